@@ -0,0 +1,43 @@
+import difflib
+from bisect import bisect_left
+from itertools import islice
+
+
+class NameIndex:
+    """A fixed list of names (a goal's exercises, timezones), searchable fast
+    enough for autocomplete.
+
+    Matching is case-insensitive: names starting with the query come first
+    (found by bisecting a sorted list), then names containing it, then close
+    misspellings. Build a new index when the names change.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._sorted = sorted((name.casefold(), name) for name in self.names)
+        self._keys = [key for key, _ in self._sorted]
+
+    def search(self, query, limit=25):
+        query = query.strip().casefold()
+        if not query:
+            return self.names[:limit]
+        results = []
+        for key, name in islice(self._sorted, bisect_left(self._keys, query), None):
+            if not key.startswith(query) or len(results) == limit:
+                break
+            results.append(name)
+        if len(results) < limit:
+            seen = set(results)
+            for key, name in self._sorted:
+                if query in key and name not in seen:
+                    results.append(name)
+                    seen.add(name)
+                    if len(results) == limit:
+                        return results
+            close = difflib.get_close_matches(query, self._keys, n=limit - len(results), cutoff=0.6)
+            for key in close:
+                name = self._sorted[bisect_left(self._keys, key)][1]
+                if name not in seen:
+                    results.append(name)
+                    seen.add(name)
+        return results
@@ -0,0 +1,196 @@
+"""Offline latency/throughput benchmark for bot.py's commands.
+
+Usage: python bench/command_benchmark.py [--participants 1 100 1000 10000]
+       [--exercises 1 10 50] [--backend sqlite] [--commands 200]
+
+For every (participants, exercises) combination this creates a goal, then
+drives /record_workout, /view_progress everyone, the midnight reset and the
+scheduled progress broadcast through the real command callbacks, with
+bench/fakediscord.py standing in for Discord. It reports p50/p99 latency,
+how long the event loop was blocked (sampled every millisecond) and bytes
+written per command (from /proc/self/io where available, else the store's
+own counter).
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fakediscord import FakeChannel, FakeClient, FakeGuild, FakeInteraction, FakeUser, Latency, install  # noqa: E402
+
+
+class LoopMonitor:
+    """Measures event-loop blocking as the lateness of a 1 ms ticker."""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.blocked = 0.0
+        self.max_block = 0.0
+        self._task = None
+
+    async def _tick(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            late = time.perf_counter() - start - self.interval
+            # Ignore ordinary timer jitter
+            if late > self.interval:
+                self.blocked += late
+                self.max_block = max(self.max_block, late)
+
+    def start(self):
+        self.blocked = 0.0
+        self.max_block = 0.0
+        self._task = asyncio.create_task(self._tick())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def bytes_written(store):
+    # wchar counts every byte handed to write(), executor threads included
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return store.stats().get('bytes_written', 0)
+
+
+def make_goal(participants, exercises, channel_id, last_reset):
+    names = [f'exercise{i}' for i in range(exercises)]
+    users = [str(100000000000000000 + i) for i in range(participants)]
+    return {
+        'name': f'Bench {participants}x{exercises}',
+        'exercises': {ex: 1000.0 for ex in names},
+        'daily_targets': {ex: 100.0 for ex in names},
+        'effective_days': 10,
+        'rest': 4,
+        'rest_used': {uid: 0 for uid in users},
+        'participants': users,
+        'total_progress': {uid: {ex: 0.0 for ex in names} for uid in users},
+        'daily_progress': {uid: {ex: 0.0 for ex in names} for uid in users},
+        'completed_days': {uid: 0.0 for uid in users},
+        'daily_credit': {uid: 0.0 for uid in users},
+        'channel_id': channel_id,
+        'last_reset': last_reset,
+    }
+
+
+async def measure(bot, label, calls):
+    await bot.store.flush()
+    monitor = LoopMonitor()
+    monitor.start()
+    before = bytes_written(bot.store)
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+    await bot.outbox.close()
+    await bot.store.flush()
+    written = bytes_written(bot.store) - before
+    await monitor.stop()
+    latencies.sort()
+    return {
+        'op': label,
+        'n': len(latencies),
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'max_block': monitor.max_block * 1000,
+        'blocked': monitor.blocked * 1000,
+        'bytes': written / len(latencies),
+    }
+
+
+async def run_scenario(bot, client, args, participants, exercises, channel_id):
+    rng = random.Random(channel_id)
+    channel = client.add_channel(FakeChannel(channel_id, FakeGuild(1), Latency(args.latency, args.latency)))
+    key = bot.goal_key(channel.guild.id, channel.id)
+    # Started today, so the first command does not close an overdue day
+    goal = make_goal(participants, exercises, channel_id, datetime.now(bot.TIMEZONE).strftime('%Y-%m-%d %H:%M:%S'))
+    bot.commit({'type': 'create_goal', 'key': key, 'goal': goal})
+    await bot.store.flush()
+    response_latency = Latency(args.latency, args.latency)
+
+    def interaction(user_id):
+        return FakeInteraction(FakeUser(int(user_id)), channel, response_latency)
+
+    users = goal['participants']
+    names = list(goal['exercises'])
+    record = [
+        (lambda uid=rng.choice(users), ex=rng.choice(names):
+         bot.record_workout.callback(interaction(uid), ex, float(rng.randint(1, 50))))
+        for _ in range(args.commands)
+    ]
+    everyone = [lambda: bot.view_progress.callback(interaction(users[0]), 'everyone') for _ in range(args.reports)]
+    # Simulated days run forward from today, so commands never see a reset as overdue
+    day = datetime.now(bot.TIMEZONE)
+    resets = [lambda i=i: bot.reset_goal(key, day + timedelta(days=i + 1)) for i in range(args.resets)]
+    broadcasts = [lambda: bot.send_progress_updates(None) for _ in range(args.broadcasts)]
+
+    results = []
+    for label, calls in (('record_workout', record), ('view_progress everyone', everyone),
+                         ('reset', resets), ('broadcast', broadcasts)):
+        results.append(await measure(bot, label, calls))
+    # Drop the goal so the next scenario's resets and broadcasts only see their own
+    bot.commit({'type': 'delete_goal', 'key': key})
+    await bot.store.flush()
+    return results
+
+
+async def run(args):
+    import bot
+
+    client = FakeClient(Latency(args.fetch_latency, args.fetch_latency))
+    install(bot, client)
+    print(f'backend={args.backend} response latency={args.latency * 1000:.1f} ms fetch latency={args.fetch_latency * 1000:.1f} ms\n')
+    print(f'{"users":>6} {"ex":>3}  {"command":<24}{"n":>5}{"p50 ms":>10}{"p99 ms":>10}{"max block ms":>14}{"blocked ms":>12}{"bytes/cmd":>12}')
+    channel_id = 1
+    for participants in args.participants:
+        for exercises in args.exercises:
+            for row in await run_scenario(bot, client, args, participants, exercises, channel_id):
+                print(f'{participants:>6} {exercises:>3}  {row["op"]:<24}{row["n"]:>5}{row["p50"]:>10.2f}{row["p99"]:>10.2f}'
+                      f'{row["max_block"]:>14.2f}{row["blocked"]:>12.1f}{row["bytes"]:>12.0f}')
+            channel_id += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--participants', type=int, nargs='+', default=[1, 100, 1000, 10000])
+    parser.add_argument('--exercises', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--backend', choices=['sqlite', 'json', 'journal'], default='sqlite')
+    parser.add_argument('--commands', type=int, default=200, help='record_workout calls per scenario')
+    parser.add_argument('--reports', type=int, default=10, help='view_progress everyone calls per scenario')
+    parser.add_argument('--resets', type=int, default=5)
+    parser.add_argument('--broadcasts', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated interaction/channel round trip in seconds')
+    parser.add_argument('--fetch-latency', type=float, default=0.05, help='simulated fetch_user round trip in seconds')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='fitbot-bench-')
+    os.environ['DATA_FILE'] = os.path.join(directory, 'workout_data.json')
+    os.environ['STORAGE_BACKEND'] = args.backend
+    os.environ['ANNOUNCE_WINDOW'] = '0'
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Local stand-ins for the parts of discord.py that bot.py touches.
+
+Enough of discord.Interaction, channels, guilds and the client's user lookups
+to call command callbacks directly (bot.record_workout.callback(interaction,
+...)) without a Discord connection. Every network call sleeps for a
+configurable simulated latency and is counted.
+"""
+import asyncio
+import random
+import time
+
+
+class Latency:
+    """Simulated round trip: uniformly random in [low, high] seconds."""
+
+    def __init__(self, low=0.0, high=0.0, seed=1):
+        self.low = low
+        self.high = high
+        self.rng = random.Random(seed)
+
+    async def wait(self):
+        delay = self.low if self.high <= self.low else self.rng.uniform(self.low, self.high)
+        await asyncio.sleep(delay)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f'user{user_id}'
+        self.mention = f'<@{user_id}>'
+
+
+class FakeGuild:
+    def __init__(self, guild_id, members=False):
+        self.id = guild_id
+        # With members=True every user is in the member cache, like a guild with the members intent
+        self.members = members
+
+    def get_member(self, user_id):
+        return FakeUser(user_id) if self.members else None
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild, latency=None):
+        self.id = channel_id
+        self.guild = guild
+        self.latency = latency or Latency()
+        self.sent = []
+        self.bytes_sent = 0
+
+    async def send(self, content):
+        await self.latency.wait()
+        self.sent.append(content)
+        self.bytes_sent += len(content.encode('utf-8'))
+
+
+class FakeResponse:
+    def __init__(self, latency):
+        self.latency = latency
+        self.messages = []
+        # perf_counter() when each message reached Discord
+        self.sent_at = []
+
+    async def send_message(self, content, ephemeral=False):
+        await self.latency.wait()
+        self.messages.append(content)
+        self.sent_at.append(time.perf_counter())
+
+
+class FakeInteraction:
+    def __init__(self, user, channel, latency=None):
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.created_at = time.perf_counter()
+        self.response = FakeResponse(latency or Latency())
+
+
+class FakeClient:
+    """The user and channel lookups bot.py makes on discord.Client."""
+
+    def __init__(self, latency=None, cached_users=False):
+        self.latency = latency or Latency()
+        self.cached_users = cached_users
+        self.channels = {}
+        self.fetches = 0
+
+    def add_channel(self, channel):
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_user(self, user_id):
+        return FakeUser(user_id) if self.cached_users else None
+
+    async def fetch_user(self, user_id):
+        self.fetches += 1
+        await self.latency.wait()
+        return FakeUser(user_id)
+
+
+def install(bot, client):
+    # Point the bot's Discord lookups at the fake client
+    bot.client = client
+    bot.names.client = client
@@ -0,0 +1,133 @@
+"""Compare the old save-everything-per-command persistence with the journal.
+
+Usage: python bench/journal_benchmark.py [--participants 20] [--exercises 5]
+
+For 10k and 1M record events this reports bytes written per event (write
+amplification) and the time to rebuild state on startup. The old
+load_data/save_data path rewrote the whole file with indent=4 on every
+command; at 1M events that is only sampled and extrapolated.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from events import apply_event  # noqa: E402
+from storage import JournalStore  # noqa: E402
+
+LEGACY_SAMPLE = 2000
+KEY = '1:1'
+
+
+def make_goal(participants, exercises):
+    names = [f'exercise{i}' for i in range(exercises)]
+    users = [str(100000000000000000 + i) for i in range(participants)]
+    return {
+        'name': 'Benchmark',
+        'exercises': {ex: 1000.0 for ex in names},
+        'daily_targets': {ex: 100.0 for ex in names},
+        'effective_days': 10,
+        'rest': 4,
+        'rest_used': {uid: 0 for uid in users},
+        'participants': users,
+        'total_progress': {uid: {ex: 0.0 for ex in names} for uid in users},
+        'daily_progress': {uid: {ex: 0.0 for ex in names} for uid in users},
+        'completed_days': {uid: 0.0 for uid in users},
+        'daily_credit': {uid: 0.0 for uid in users},
+        'channel_id': 1,
+    }
+
+
+def make_events(goal, count, seed=1):
+    rng = random.Random(seed)
+    users = goal['participants']
+    names = list(goal['exercises'])
+    for _ in range(count):
+        yield {
+            'type': 'record',
+            'key': KEY,
+            'user': rng.choice(users),
+            'exercise': rng.choice(names),
+            'daily': float(rng.randint(0, 100)),
+            'total': float(rng.randint(0, 1000)),
+        }
+
+
+def bench_legacy(directory, goal, count):
+    path = os.path.join(directory, 'legacy.json')
+    goals = {KEY: json.loads(json.dumps(goal))}
+    sample = min(count, LEGACY_SAMPLE)
+    written = 0
+    start = time.perf_counter()
+    for event in make_events(goal, sample):
+        apply_event(goals, event)
+        with open(path, 'w') as f:
+            json.dump({'goal': goals[KEY]}, f, indent=4)
+        written += os.path.getsize(path)
+    write_time = (time.perf_counter() - start) * count / sample
+    written = written * count // sample
+    start = time.perf_counter()
+    with open(path, 'r') as f:
+        json.load(f)
+    recovery = time.perf_counter() - start
+    return written, write_time, recovery
+
+
+def bench_journal(directory, goal, count, snapshot_every):
+    path = os.path.join(directory, f'journal-{snapshot_every}.json')
+    store = JournalStore(path, snapshot_every=snapshot_every)
+    store.load()
+    store.goals[KEY] = json.loads(json.dumps(goal))
+    store.compact_sync([KEY])
+    store.bytes_written = 0
+    start = time.perf_counter()
+    for i, event in enumerate(make_events(goal, count), 1):
+        apply_event(store.goals, event)
+        store.append(event)
+        # Roughly what the background flush sees with a busy channel
+        if i % 50 == 0:
+            store.flush_sync()
+    store.flush_sync()
+    write_time = time.perf_counter() - start
+    written = store.bytes_written
+    start = time.perf_counter()
+    recovered = JournalStore(path, snapshot_every=snapshot_every)
+    recovered.load()
+    recovery = time.perf_counter() - start
+    assert recovered.goals == store.goals, 'replayed state differs from live state'
+    return written, write_time, recovery, recovered.replayed_events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--participants', type=int, default=20)
+    parser.add_argument('--exercises', type=int, default=5)
+    parser.add_argument('--events', type=int, nargs='+', default=[10_000, 1_000_000])
+    parser.add_argument('--snapshot-every', type=int, default=1000)
+    args = parser.parse_args()
+
+    goal = make_goal(args.participants, args.exercises)
+    directory = tempfile.mkdtemp(prefix='fitbot-bench-')
+    try:
+        print(f'{args.participants} participants, {args.exercises} exercises\n')
+        print(f'{"events":>9}  {"backend":<24}{"bytes/event":>12}{"write s":>10}{"recovery ms":>13}{"replayed":>10}')
+        for count in args.events:
+            written, write_time, recovery = bench_legacy(directory, goal, count)
+            print(f'{count:>9}  {"save_data (extrapolated)":<24}{written / count:>12.1f}{write_time:>10.2f}{recovery * 1000:>13.2f}{"-":>10}')
+            # Never compacting shows the cost of replaying the whole journal
+            for snapshot_every in (args.snapshot_every, count + 1):
+                label = f'journal/{snapshot_every}' if snapshot_every <= count else 'journal/no snapshot'
+                written, write_time, recovery, replayed = bench_journal(directory, goal, count, snapshot_every)
+                print(f'{count:>9}  {label:<24}{written / count:>12.1f}{write_time:>10.2f}{recovery * 1000:>13.2f}{replayed:>10}')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
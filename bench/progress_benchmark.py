@@ -0,0 +1,108 @@
+"""Memory, reset time and snapshot size of nested-dict vs array-backed progress.
+
+Usage: python bench/progress_benchmark.py [--participants 100000] [--exercises 10]
+
+Compares the old representation (daily_progress[user_id][exercise] as
+nested dicts) with progress.ProgressTable for one goal: memory held by the
+daily and total progress, the midnight reset, capping a target with
+/change_goal, and writing and reading a snapshot as indented JSON (the old
+save_data format), compact JSON and the packed binary form.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from progress import ProgressTable, compact_goal, packed, to_json  # noqa: E402
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--participants', type=int, default=100000)
+    parser.add_argument('--exercises', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    exercises = {f'exercise{i}': 1000.0 for i in range(args.exercises)}
+    users = [str(100000000000000000 + i) for i in range(args.participants)]
+    # Use distinct non-zero amounts so nothing is shared between entries
+    def amounts(i):
+        return {ex: float(i % 97 + j) for j, ex in enumerate(exercises)}
+
+    dicts, dict_bytes = measure_memory(lambda: {
+        'daily_progress': {uid: amounts(i) for i, uid in enumerate(users)},
+        'total_progress': {uid: amounts(i) for i, uid in enumerate(users)},
+    })
+    tables, table_bytes = measure_memory(lambda: {
+        'daily_progress': ProgressTable.from_dict(dicts['daily_progress'], exercises),
+        'total_progress': ProgressTable.from_dict(dicts['total_progress'], exercises),
+    })
+    # The user id strings are shared with `dicts` above; count them once for the table too
+    table_bytes += sum(sys.getsizeof(uid) for uid in users)
+
+    print(f'{args.participants} participants x {args.exercises} exercises\n')
+    print(f'{"":<34}{"nested dicts":>14}{"ProgressTable":>15}')
+    print(f'{"daily + total progress memory":<34}{dict_bytes / 2 ** 20:>11.1f} MB{table_bytes / 2 ** 20:>12.1f} MB')
+
+    credit = dict.fromkeys(users, 1.0)
+
+    def dict_reset():
+        daily = dicts['daily_progress']
+        for uid in users:
+            daily[uid] = {ex: 0.0 for ex in exercises}
+            credit[uid] = 0.0
+
+    def table_reset():
+        tables['daily_progress'].fill(0.0)
+        credit.update(dict.fromkeys(users, 0.0))
+
+    first = next(iter(exercises))
+
+    def dict_cap():
+        for uid in users:
+            daily = dicts['total_progress'][uid]
+            if daily[first] > 50.0:
+                daily[first] = 50.0
+
+    print(f'{"midnight reset":<34}{timed(dict_reset, args.repeat) * 1000:>11.1f} ms{timed(table_reset, args.repeat) * 1000:>12.1f} ms')
+    print(f'{"change_goal cap of one exercise":<34}{timed(dict_cap, args.repeat) * 1000:>11.1f} ms'
+          f'{timed(lambda: tables["total_progress"].cap(first, 50.0), args.repeat) * 1000:>12.1f} ms')
+
+    goal = {'exercises': exercises, **tables}
+    print()
+    print(f'{"snapshot":<20}{"bytes":>14}{"write ms":>10}{"read ms":>10}')
+    for label, dump in (
+        ('indented JSON', lambda: json.dumps(goal, indent=4, default=to_json)),
+        ('compact JSON', lambda: json.dumps(goal, separators=(',', ':'), default=to_json)),
+        ('packed binary', lambda: json.dumps(goal, separators=(',', ':'), default=packed)),
+    ):
+        text = dump()
+        write = timed(dump, args.repeat)
+        read = timed(lambda: compact_goal(json.loads(text)), args.repeat)
+        print(f'{label:<20}{len(text.encode("utf-8")):>14,}{write * 1000:>10.1f}{read * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
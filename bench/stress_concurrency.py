@@ -0,0 +1,164 @@
+"""Fire thousands of concurrent simulated commands at bot.py and check invariants.
+
+Usage: python bench/stress_concurrency.py [--goals 4] [--users 200] [--commands 5000]
+
+Commands for several goals (record, fix, completed_full/half, claim_rest,
+view_progress, leaderboard) run concurrently with midnight resets, each
+interaction's response taking a random few milliseconds. Every interaction
+must be answered once and within Discord's 3 second deadline. Afterwards the
+journal is replayed event by event to check that no credit was granted twice
+and that state, aggregates and the journal all agree.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fakediscord import FakeChannel, FakeClient, FakeGuild, FakeInteraction, FakeUser, Latency, install  # noqa: E402
+
+EXERCISES = 'situps:100,pushups:50,squats:20'
+# Discord drops an interaction that gets no response within this many seconds
+RESPONSE_DEADLINE = 3.0
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def read_journal(store):
+    events = []
+    for name in sorted(os.listdir(store.shard_dir)):
+        if name.endswith('.journal'):
+            with open(os.path.join(store.shard_dir, name)) as f:
+                events.extend(json.loads(line) for line in f)
+    return events
+
+
+def verify(bot, resets):
+    from events import apply_event
+    from leaderboard import GoalIndex
+
+    # Replay in journal order: every credit change must match its completed_days change
+    replayed = {}
+    credited = 0
+    for event in read_journal(bot.store):
+        if 'credit' in event:
+            goal = replayed[event['key']]
+            user_id = event['user']
+            gained = event['credit'] - goal['daily_credit'][user_id]
+            check(gained > 0, f'credit did not increase: {event}')
+            check(event['credit'] <= 1.0, f'credit above a full day: {event}')
+            check(abs(event['completed_days'] - goal['completed_days'][user_id] - gained) < 1e-9,
+                  f'completed_days moved by more than the credit gained: {event}')
+            credited += 1
+        apply_event(replayed, event)
+    check(replayed == bot.goals, 'replaying the journal does not reproduce live state')
+
+    for key, goal in bot.goals.items():
+        index = bot.aggregates.get(key)
+        fresh = GoalIndex(goal)
+        check(index.ranking == fresh.ranking, f'{key}: leaderboard drifted from state')
+        for ex, amount in fresh.team_totals.items():
+            check(abs(index.team_totals[ex] - amount) < 1e-6, f'{key}: team total for {ex} drifted')
+        for user_id in goal['participants']:
+            check(goal['completed_days'][user_id] <= resets[key] + 1, f'{key}: {user_id} has more credit than days')
+            check(goal['daily_credit'][user_id] in (0.0, 0.5, 1.0), f'{key}: odd daily credit')
+            for ex, target in goal['daily_targets'].items():
+                check(goal['daily_progress'][user_id][ex] <= target, f'{key}: daily {ex} above target')
+                check(goal['total_progress'][user_id][ex] <= goal['exercises'][ex], f'{key}: total {ex} above goal')
+    return credited
+
+
+async def run(args):
+    import bot
+
+    rng = random.Random(args.seed)
+    latency = Latency(0.0, args.latency, args.seed)
+    client = FakeClient()
+    install(bot, client)
+    channels = [client.add_channel(FakeChannel(1000 + i, FakeGuild(1 + i % 2, members=True))) for i in range(args.goals)]
+    users = [FakeUser(10_000 + i) for i in range(args.users)]
+    interactions = []
+
+    def interaction(user, channel):
+        inter = FakeInteraction(user, channel, latency)
+        interactions.append(inter)
+        return inter
+
+    for channel in channels:
+        await bot.create_goal.callback(interaction(users[0], channel), 'Stress', EXERCISES, 4)
+    await asyncio.gather(*(bot.join_goal.callback(interaction(user, channel))
+                           for channel in channels for user in users))
+
+    # Simulated days run forward from today, so commands never see a reset as overdue
+    day = datetime.now(bot.TIMEZONE)
+    resets = {bot.goal_key(channel.guild.id, channel.id): 0 for channel in channels}
+    exercises = [pair.split(':')[0] for pair in EXERCISES.split(',')]
+    tasks = []
+    for i in range(args.commands):
+        channel = rng.choice(channels)
+        inter = interaction(rng.choice(users), channel)
+        roll = rng.random()
+        if roll < 0.5:
+            tasks.append(bot.record_workout.callback(inter, rng.choice(exercises), float(rng.randint(1, 60))))
+        elif roll < 0.6:
+            tasks.append(bot.fix_progress.callback(inter, rng.choice(exercises), float(rng.randint(0, 100))))
+        elif roll < 0.7:
+            tasks.append(bot.completed_full.callback(inter))
+        elif roll < 0.8:
+            tasks.append(bot.completed_half.callback(inter))
+        elif roll < 0.85:
+            tasks.append(bot.claim_rest.callback(inter))
+        elif roll < 0.95:
+            tasks.append(bot.view_progress.callback(inter, rng.choice(['me', 'everyone'])))
+        else:
+            tasks.append(bot.leaderboard.callback(inter, 5))
+        if i % args.reset_every == args.reset_every - 1:
+            day += timedelta(days=1)
+            for key in resets:
+                resets[key] += 1
+                tasks.append(bot.reset_goal(key, day))
+    await asyncio.gather(*tasks)
+    await bot.outbox.close()
+    bot.store.flush_sync()
+
+    check(all(len(inter.response.messages) == 1 for inter in interactions), 'an interaction was not answered exactly once')
+    slowest = max(inter.response.sent_at[0] - inter.created_at for inter in interactions)
+    check(slowest < RESPONSE_DEADLINE, f'slowest response took {slowest:.2f}s, past the {RESPONSE_DEADLINE:.0f}s deadline')
+    credited = verify(bot, resets)
+    print(f'{len(interactions)} interactions over {args.goals} goals, {sum(resets.values())} resets, '
+          f'{credited} credit events, lock contention {bot.goal_locks.contended}, slowest response {slowest:.2f}s: '
+          'all invariants hold')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--goals', type=int, default=4)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--commands', type=int, default=5000)
+    parser.add_argument('--reset-every', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.005, help='max simulated response latency in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='fitbot-stress-')
+    os.environ['DATA_FILE'] = os.path.join(directory, 'workout_data.json')
+    os.environ['STORAGE_BACKEND'] = 'journal'
+    os.environ['SNAPSHOT_EVERY'] = str(10 ** 9)
+    os.environ['ANNOUNCE_WINDOW'] = '0'
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
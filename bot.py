@@ -1,70 +1,318 @@
 import discord
 from discord import app_commands
-import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
-from dotenv import load_dotenv
+import aiohttp
+import math
+import signal
+import tempfile
+import time
+import zlib
+from functools import partial, wraps
 import pytz
+from autocomplete import NameIndex
+from commandsync import CommandSync
+from csvimport import EntryImport, fetch_lines
+from events import apply_event, goal_key
+from history import History
+from leaderboard import Aggregates, format_amount
+from locks import GoalLocks
+from metrics import Metrics
+from names import NameCache
+from outbox import Outbox
+from scheduler import Scheduler
+from storage import open_store
 
-# Load environment variables from .env file
-load_dotenv()
+# Cold start is timed from here to the first on_ready
+started_at = time.perf_counter()
+
+# Settings come from the environment; main.py loads them from .env before importing this module
 
 # File for storing data
-DATA_FILE = 'workout_data.json'
+DATA_FILE = os.getenv('DATA_FILE', 'workout_data.json')
+
+TIMEZONE = pytz.timezone(os.getenv('TIMEZONE', 'America/New_York'))  # Default to America/New_York if not set
+
+# Goals' midnight resets and progress updates are spread over this many seconds after the hour
+SCHEDULE_SPREAD = float(os.getenv('SCHEDULE_SPREAD', '300'))
+
+# Command latency and event-loop lag histograms plus a /metrics endpoint; off unless METRICS_PORT is set
+metrics = Metrics(port=int(os.getenv('METRICS_PORT', '0')), host=os.getenv('METRICS_HOST', '127.0.0.1'))
+
+# Writes are batched in the background instead of on every command
+store = open_store(
+    DATA_FILE,
+    backend=os.getenv('STORAGE_BACKEND', 'sqlite'),
+    flush_interval=float(os.getenv('SAVE_INTERVAL', '5')),
+    max_dirty=int(os.getenv('SAVE_MAX_DIRTY', '50')),
+    snapshot_every=int(os.getenv('SNAPSHOT_EVERY', '1000')),
+)
+
+# Finished days of each goal, appended at every reset, for /stats and /export_history
+history = History(os.path.splitext(DATA_FILE)[0] + '_history')
 
 # Load/save data
 def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    return {'goal': None}
+    start = time.perf_counter()
+    data = store.load()
+    metrics.observe('load_seconds', time.perf_counter() - start)
+    return data
+
+# Apply a state change and hand it to the store
+def commit(event):
+    apply_event(goals, event)
+    aggregates.apply(goals, event)
+    track_zone(event)
+    store.append(event)
+
+# Each channel has its own goal
+def channel_key(interaction):
+    return goal_key(interaction.guild_id, interaction.channel_id)
 
-def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+def find_goal(interaction):
+    key = channel_key(interaction)
+    return key, goals.get(key)
 
-data = load_data()
+# Commands that change a goal run one at a time per goal, in arrival order, and start the
+# goal's new day first if its midnight has passed. They return their response with reply()
+# and it is sent once the lock is released, so Discord round trips on one goal overlap
+goal_locks = GoalLocks()
+
+def serialized(func):
+    @goal_locks.serialized(channel_key)
+    @wraps(func)
+    async def wrapper(interaction, *args, **kwargs):
+        await start_day_if_due(channel_key(interaction))
+        return await func(interaction, *args, **kwargs)
+    return wrapper
+
+def reply(content, **options):
+    return content, options
+
+# Goals saved before multi-guild support are keyed without their guild; fix that once the channel is known
+async def adopt_legacy_goals():
+    for key in [key for key in goals if key.startswith('0:')]:
+        channel = client.get_channel(goals[key]['channel_id'])
+        guild = getattr(channel, 'guild', None)
+        if guild is None:
+            continue
+        new_key = goal_key(guild.id, channel.id)
+        # Under both keys' locks, so a catch-up reset or a command never sees the goal move mid-way
+        async with goal_locks.hold(key), goal_locks.hold(new_key):
+            if key in goals and new_key not in goals:
+                commit({'type': 'move_goal', 'key': key, 'new_key': new_key})
+                history.move(key, new_key)
+
+goals = load_data()
+# Team totals, leaderboard and report fragments, updated by commit()
+aggregates = Aggregates(goals)
+
+# Runs once per process, unlike on_ready which fires again after every reconnect
+class FitBotClient(discord.Client):
+    scheduler_task = None
+
+    async def setup_hook(self):
+        await store.start()
+        await metrics.start()
+        await command_sync.sync()
+        self.scheduler_task = asyncio.create_task(scheduler.run())
+
+    async def close(self):
+        if self.scheduler_task is not None:
+            self.scheduler_task.cancel()
+        await outbox.close()
+        await store.close()
+        await metrics.close()
+        await super().close()
 
 intents = discord.Intents.default()
 intents.message_content = True
-client = discord.Client(intents=intents)
+client = FitBotClient(intents=intents)
 tree = app_commands.CommandTree(client)
 
+# Commands are uploaded only when their definitions changed since the last upload; SYNC_GUILDS limits that to the listed servers
+command_sync = CommandSync(
+    tree,
+    os.path.splitext(DATA_FILE)[0] + '_commands.json',
+    guild_ids=[int(guild_id) for guild_id in os.getenv('SYNC_GUILDS', '').split(',') if guild_id.strip()],
+)
+
+# Channel announcements are queued and merged instead of sent inline
+outbox = Outbox(window=float(os.getenv('ANNOUNCE_WINDOW', '2')))
+
+# Participant names for progress reports, instead of one fetch_user per participant
+names = NameCache(
+    client,
+    ttl=float(os.getenv('NAME_CACHE_TTL', '3600')),
+    max_size=int(os.getenv('NAME_CACHE_SIZE', '10000')),
+)
+
+# Reconnect time, reported in the log and in metrics
+disconnected_at = None
+
+@client.event
+async def on_disconnect():
+    global disconnected_at
+    if disconnected_at is None:
+        disconnected_at = time.perf_counter()
+
 @client.event
 async def on_ready():
-    await tree.sync()
-    print(f'Bot is ready: {client.user}')
-    client.loop.create_task(progress_scheduler())
+    global disconnected_at
+    await adopt_legacy_goals()
+    if disconnected_at is None:
+        elapsed = time.perf_counter() - started_at
+        metrics.observe('startup_seconds', elapsed)
+        print(f'Bot is ready: {client.user} (started in {elapsed:.2f}s)')
+    else:
+        elapsed = time.perf_counter() - disconnected_at
+        disconnected_at = None
+        metrics.observe('reconnect_seconds', elapsed)
+        print(f'Bot is ready again: {client.user} (reconnected in {elapsed:.2f}s)')
 
-async def progress_scheduler():
-    timezone = os.getenv('TIMEZONE', 'America/New_York')  # Default to America/New_York if not set
-    tz = pytz.timezone(timezone)
-    while True:
-        now = datetime.now(tz)
-        if now.minute == 0 and now.hour in (12, 20):
-            if data['goal']:
-                channel = client.get_channel(data['goal']['channel_id'])
-                if channel:
-                    msg = await build_everyone_daily_message(data['goal'])
-                    await channel.send(f"Progress Update:\n{msg}")
-        # Date-based reset at midnight
-        if data['goal'] and ('last_reset' not in data['goal'] or data['goal']['last_reset'].split(' ')[0] != now.strftime('%Y-%m-%d')):
-            goal = data['goal']
-            # Reset daily progress and credit
-            for user_id in goal['participants']:
-                goal['daily_progress'][user_id] = {ex: 0.0 for ex in goal['exercises']}
-                goal['daily_credit'][user_id] = 0.0
-            goal['last_reset'] = now.strftime('%Y-%m-%d %H:%M:%S')
-            save_data(data)
-        await asyncio.sleep(60)  # Check every minute
-
-async def build_my_progress_message(goal, user_id):
-    try:
-        user = await client.fetch_user(int(user_id))
-        username = user.name
-    except:
-        username = f'Unknown User ({user_id})'
+@client.event
+async def on_resumed():
+    global disconnected_at
+    if disconnected_at is not None:
+        metrics.observe('reconnect_seconds', time.perf_counter() - disconnected_at)
+        disconnected_at = None
+
+@client.event
+async def on_interaction(interaction):
+    # Anyone using a command has their current name on hand already
+    names.remember(interaction.user)
+
+# Sleeps until the next job is due instead of polling
+scheduler = Scheduler(TIMEZONE)
+
+def goal_timezone(goal):
+    # Goals without their own timezone follow TIMEZONE
+    zone = goal.get('timezone')
+    return pytz.timezone(zone) if zone else TIMEZONE
+
+# Keys of the goals in each timezone, and each goal's zone; kept current by commit()
+zone_goals = {}
+goal_zones = {}
+
+def place_goal(key, zone=None):
+    # Moves a goal to zone's bucket, or out of all of them with None; buckets are scheduled while they have goals
+    if goal_zones.get(key) == zone:
+        return
+    old = goal_zones.pop(key, None)
+    if old is not None:
+        zone_goals[old].discard(key)
+        if not zone_goals[old]:
+            del zone_goals[old]
+            unschedule_zone(old)
+    if zone is not None:
+        goal_zones[key] = zone
+        if zone not in zone_goals:
+            zone_goals[zone] = set()
+            schedule_zone(pytz.timezone(zone))
+        zone_goals[zone].add(key)
+
+def track_zone(event):
+    kind = event['type']
+    key = event['key']
+    if kind in ('create_goal', 'set_timezone'):
+        place_goal(key, goal_timezone(goals[key]).zone)
+    elif kind == 'delete_goal':
+        place_goal(key)
+    elif kind == 'move_goal':
+        zone = goal_zones.get(key)
+        place_goal(key)
+        place_goal(event['new_key'], zone)
+
+def goals_in_zone(zone):
+    return list(zone_goals.get(zone, ()))
+
+def jitter(key):
+    # Seconds after the deadline that this goal's turn comes, the same every day
+    return zlib.crc32(key.encode('utf-8')) % 1000 / 1000 * SCHEDULE_SPREAD
+
+async def spread(deadline, keys, work):
+    # Run work(key) for each goal at its own offset into the window; at once when catching up (no deadline)
+    for offset, key in sorted((jitter(key), key) for key in keys):
+        if deadline is not None:
+            delay = deadline.timestamp() + offset - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if key in goals:
+            await work(key)
+
+# Date-based reset at midnight in each goal's timezone; also runs at startup to catch up on days missed while offline
+async def reset_due_goals(deadline, keys=None):
+    await spread(deadline, list(goals) if keys is None else keys, reset_if_due)
+
+async def reset_if_due(key):
+    async with goal_locks.hold(key):
+        await start_day_if_due(key)
+
+# Commands that change a goal call this under its lock first, so the jittered reset only
+# delays background work: nothing is recorded into a day that has already ended
+async def start_day_if_due(key):
+    goal = goals.get(key)
+    if goal is None:
+        return
+    now = datetime.now(goal_timezone(goal))
+    if 'last_reset' not in goal or goal['last_reset'].split(' ')[0] < now.strftime('%Y-%m-%d'):
+        await start_day(key, now)
+
+async def reset_goal(key, now):
+    async with goal_locks.hold(key):
+        if key in goals:
+            await start_day(key, now)
+
+async def start_day(key, now):
+    # The caller holds the goal's lock
+    goal = goals[key]
+    if 'last_reset' in goal:
+        # Keep the finished day's numbers before they are cleared
+        await history.close_day(key, goal, goal['last_reset'].split(' ')[0])
+    # Reset daily progress and credit
+    commit({'type': 'reset', 'key': key, 'at': now.strftime('%Y-%m-%d %H:%M:%S')})
+
+async def send_progress_updates(deadline, keys=None):
+    await spread(deadline, list(goals) if keys is None else keys, send_progress_update)
+
+async def send_progress_update(key):
+    goal = goals.get(key)
+    channel = client.get_channel(goal['channel_id']) if goal else None
+    if channel:
+        msg = await build_everyone_daily_message(key, goal, getattr(channel, 'guild', None))
+        outbox.announce(channel, f"Progress Update:\n{msg}")
+
+async def reset_zone(zone, deadline):
+    await reset_due_goals(deadline, goals_in_zone(zone))
+
+async def update_zone(zone, deadline):
+    await send_progress_updates(deadline, goals_in_zone(zone))
+
+# One bucket of jobs per timezone in use, each firing at that zone's midnight and update hours.
+# Buckets are keyed by zone name rather than UTC offset, since zones sharing an offset today
+# can differ after a DST change
+zone_jobs = {}
+
+def schedule_zone(tz):
+    zone_jobs[tz.zone] = [scheduler.add_daily(f'reset {tz.zone}', 0, 0, partial(reset_zone, tz.zone), catch_up=True, tz=tz)]
+    for hour in (12, 20):
+        zone_jobs[tz.zone].append(scheduler.add_daily(f'progress_{hour} {tz.zone}', hour, 0, partial(update_zone, tz.zone), tz=tz))
+
+def unschedule_zone(zone):
+    for job in zone_jobs.pop(zone):
+        scheduler.cancel(job)
+
+for key, goal in goals.items():
+    place_goal(key, goal_timezone(goal).zone)
+
+# Queue depths, I/O and REST time from each component, for /metrics and /bot_stats
+for source, stats in (('store', store.stats), ('outbox', outbox.stats), ('names', names.stats),
+                      ('scheduler', scheduler.stats), ('locks', goal_locks.stats), ('command_sync', command_sync.stats),
+                      ('history', history.stats)):
+    metrics.add_source(source, stats)
+
+def build_my_progress_message(goal, user_id):
     msg = f'Your Progress for "{goal["name"]}":\nRest used: {goal["rest_used"].get(user_id, 0)}/{goal["rest"]} (Completed Days: {goal["completed_days"][user_id]}/{goal["effective_days"]})\n'
     msg += '  Daily Progress:\n'
     for ex, val in goal['daily_progress'][user_id].items():
@@ -72,34 +320,41 @@ async def build_my_progress_message(goal, user_id):
         msg += f'    {ex}: {display_val}/{goal["daily_targets"][ex]}\n'
     return msg
 
-async def build_everyone_daily_message(goal):
-    msg = f'Goal "{goal["name"]}" Daily Progress:\n'
+async def build_everyone_daily_message(key, goal, guild=None):
+    usernames = await names.resolve(goal['participants'], guild)
+    # Per-user sections are cached and only rebuilt when that user's progress changes
+    index = aggregates.get(key)
+    parts = [f'Goal "{goal["name"]}" Daily Progress:\n']
     for user_id in goal['participants']:
-        try:
-            user = await client.fetch_user(int(user_id))
-            username = user.name
-        except:
-            username = f'Unknown User ({user_id})'
-        msg += f'{username} (Rest used: {goal["rest_used"].get(user_id, 0)}/{goal["rest"]} (Completed Days: {goal["completed_days"][user_id]}/{goal["effective_days"]})) :\n'
-        for ex, val in goal['daily_progress'][user_id].items():
-            display_val = int(val) if val % 1 == 0 else f'{val:.1f}'
-            msg += f'  {ex}: {display_val}/{goal["daily_targets"][ex]}\n'
-    return msg
+        parts.append(usernames[user_id])
+        parts.append(index.fragment(goal, user_id))
+    return ''.join(parts)
 
 # /create_goal
-@tree.command(name='create_goal', description='Create a workout goal with per-day amounts (only if no current goal)')
+# Timezone names for autocomplete; any name pytz knows is accepted
+timezone_index = NameIndex(sorted(pytz.common_timezones))
+
+async def timezone_autocomplete(interaction: discord.Interaction, current: str):
+    return [app_commands.Choice(name=zone, value=zone) for zone in timezone_index.search(current)]
+
+@tree.command(name='create_goal', description='Create a workout goal with per-day amounts for this channel (only if it has no current goal)')
 @app_commands.describe(
     name='Goal name',
     exercises='Comma-separated exercise:daily_amount, e.g., situps:100,pushups:50,squats:50',
-    weeks='Number of weeks (5 workout days + 2 rest per week, default 2)'
+    weeks='Number of weeks (5 workout days + 2 rest per week, default 2)',
+    timezone=f'Timezone for the midnight reset and progress updates (default {TIMEZONE.zone})'
 )
-async def create_goal(interaction: discord.Interaction, name: str, exercises: str, weeks: int = 2):
-    if data['goal']:
-        await interaction.response.send_message('A goal already exists! Delete it first with /delete_goal.', ephemeral=True)
-        return
+@app_commands.autocomplete(timezone=timezone_autocomplete)
+@metrics.timed
+@serialized
+async def create_goal(interaction: discord.Interaction, name: str, exercises: str, weeks: int = 2, timezone: str = None):
+    key, goal = find_goal(interaction)
+    if goal:
+        return reply('A goal already exists in this channel! Delete it first with /delete_goal.', ephemeral=True)
     if weeks < 1:
-        await interaction.response.send_message('Weeks must be at least 1!', ephemeral=True)
-        return
+        return reply('Weeks must be at least 1!', ephemeral=True)
+    if timezone is not None and timezone not in pytz.all_timezones_set:
+        return reply(f'Unknown timezone "{timezone}"! Pick one from the list, e.g., Europe/London.', ephemeral=True)
     exercise_dict = {}
     daily_targets = {}
     for pair in exercises.split(','):
@@ -107,15 +362,16 @@ async def create_goal(interaction: discord.Interaction, name: str, exercises: st
             ex, daily = pair.split(':')
             ex = ex.strip()
             daily_amount = float(daily.strip())
+            if not math.isfinite(daily_amount):
+                return reply(f'Invalid amount for {ex}!', ephemeral=True)
             daily_targets[ex] = daily_amount
     if not daily_targets:
-        await interaction.response.send_message('Add at least one valid exercise:daily_amount pair!', ephemeral=True)
-        return
+        return reply('Add at least one valid exercise:daily_amount pair!', ephemeral=True)
     effective_days = weeks * 5
     rest = weeks * 2
     totals = {ex: daily * effective_days for ex, daily in daily_targets.items()}
     user_id = str(interaction.user.id)
-    data['goal'] = {
+    goal = {
         'name': name,
         'exercises': totals,
         'daily_targets': daily_targets,
@@ -127,30 +383,50 @@ async def create_goal(interaction: discord.Interaction, name: str, exercises: st
         'daily_progress': {user_id: {ex: 0.0 for ex in totals}},
         'completed_days': {user_id: 0.0},
         'daily_credit': {user_id: 0.0},
-        'channel_id': interaction.channel.id
+        'channel_id': interaction.channel.id,
     }
-    save_data(data)
-    await interaction.response.send_message(f'Goal "{name}" created! Daily amounts: {", ".join([f"{ex}:{amt}" for ex, amt in daily_targets.items()])}. Total weeks: {weeks}, Effective workout days: {effective_days}. Join with /join_goal.')
+    if timezone is not None:
+        goal['timezone'] = timezone
+    goal['last_reset'] = datetime.now(goal_timezone(goal)).strftime('%Y-%m-%d %H:%M:%S')
+    commit({'type': 'create_goal', 'key': key, 'goal': goal})
+    return reply(f'Goal "{name}" created! Daily amounts: {", ".join([f"{ex}:{amt}" for ex, amt in daily_targets.items()])}. Total weeks: {weeks}, Effective workout days: {effective_days}. Join with /join_goal.')
 
 # /join_goal
 @tree.command(name='join_goal', description='Join the current goal')
+@metrics.timed
+@serialized
 async def join_goal(interaction: discord.Interaction):
-    if not data['goal']:
-        await interaction.response.send_message('No active goal!', ephemeral=True)
-        return
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal!', ephemeral=True)
     user_id = str(interaction.user.id)
-    goal = data['goal']
     if user_id in goal['participants']:
-        await interaction.response.send_message('Already joined!', ephemeral=True)
-        return
-    goal['participants'].append(user_id)
-    goal['total_progress'][user_id] = {ex: 0.0 for ex in goal['exercises']}
-    goal['daily_progress'][user_id] = {ex: 0.0 for ex in goal['exercises']}
-    goal['completed_days'][user_id] = 0.0
-    goal['daily_credit'][user_id] = 0.0
-    goal['rest_used'][user_id] = 0  # Initialize per-person rest used
-    save_data(data)
-    await interaction.response.send_message(f'Joined "{goal["name"]}"!')
+        return reply('Already joined!', ephemeral=True)
+    commit({'type': 'join', 'key': key, 'user': user_id})
+    return reply(f'Joined "{goal["name"]}"!')
+
+# Suggests the goal's exercises as the user types, with what they have left today
+async def exercise_autocomplete(interaction: discord.Interaction, current: str):
+    key, goal = find_goal(interaction)
+    if not goal:
+        return []
+    user_id = str(interaction.user.id)
+    daily = goal['daily_progress'][user_id] if user_id in goal['daily_progress'] else None
+    index = aggregates.get(key).exercise_index
+    if daily is not None and not current.strip():
+        # Nothing typed yet: exercises still short of today's target first
+        matches = sorted(index.names, key=lambda ex: daily[ex] >= goal['daily_targets'][ex])[:25]
+    else:
+        matches = index.search(current)
+    choices = []
+    for ex in matches:
+        target = goal['daily_targets'][ex]
+        if daily is None:
+            label = f'{ex} (daily target {format_amount(target)})'
+        else:
+            label = f'{ex} ({format_amount(daily[ex])}/{format_amount(target)} today, {format_amount(max(target - daily[ex], 0.0))} left)'
+        choices.append(app_commands.Choice(name=label[:100], value=ex[:100]))
+    return choices
 
 # /record_workout
 @tree.command(name='record_workout', description='Record your workout for an exercise')
@@ -158,46 +434,162 @@ async def join_goal(interaction: discord.Interaction):
     exercise='Exercise name',
     amount='Amount completed'
 )
+@app_commands.autocomplete(exercise=exercise_autocomplete)
+@metrics.timed
+@serialized
 async def record_workout(interaction: discord.Interaction, exercise: str, amount: float):
-    if not data['goal']:
-        await interaction.response.send_message('No active goal!', ephemeral=True)
-        return
-    goal = data['goal']
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal!', ephemeral=True)
     user_id = str(interaction.user.id)
     if user_id not in goal['total_progress'] or exercise not in goal['exercises']:
-        await interaction.response.send_message('Not joined or invalid exercise!', ephemeral=True)
-        return
+        return reply('Not joined or invalid exercise!', ephemeral=True)
     if amount < 0:
-        await interaction.response.send_message('Amount must be positive!', ephemeral=True)
-        return
+        return reply('Amount must be positive!', ephemeral=True)
     # Update daily, cap at daily_target
     current_daily = goal['daily_progress'][user_id][exercise]
     daily_target = goal['daily_targets'][exercise]
     new_daily = min(current_daily + amount, daily_target)
     added_to_daily = new_daily - current_daily
-    goal['daily_progress'][user_id][exercise] = new_daily
     # Update total
     current_total = goal['total_progress'][user_id][exercise]
     total = goal['exercises'][exercise]
     new_total = min(current_total + added_to_daily, total)
-    goal['total_progress'][user_id][exercise] = new_total
-    save_data(data)
-    status = 'Completed!' if new_total == total else f'{new_total}/{total}'
-    mention = ' '.join([f'<@{uid}>' for uid in goal['participants'] if uid != user_id])
-    await interaction.channel.send(f'{interaction.user.name} recorded {exercise}: +{added_to_daily}. Total Progress: {status} for "{goal["name"]}". {mention}')
-    await interaction.response.send_message('Workout recorded!', ephemeral=True)
-
+    event = {'type': 'record', 'key': key, 'user': user_id, 'exercise': exercise, 'daily': new_daily, 'total': new_total}
     # Check if all exercises have hit daily goals
-    all_completed = all(goal['daily_progress'][user_id][ex] >= goal['daily_targets'][ex] for ex in goal['daily_targets'])
-    if all_completed and goal['daily_credit'][user_id] < 1.0:
+    all_completed = goal['daily_progress'].reached(user_id, goal['daily_targets'], {exercise: new_daily})
+    newly_completed = all_completed and goal['daily_credit'][user_id] < 1.0
+    if newly_completed:
         # Mark as full day completed
-        add_credit = 1.0 - goal['daily_credit'][user_id]
-        goal['completed_days'][user_id] += add_credit
-        goal['daily_credit'][user_id] = 1.0
-        save_data(data)
-        await interaction.channel.send(f'{interaction.user.name} has now completed a full workout for the day after recording! {mention}')
+        event['completed_days'] = goal['completed_days'][user_id] + 1.0 - goal['daily_credit'][user_id]
+        event['credit'] = 1.0
+    commit(event)
+    status = 'Completed!' if new_total == total else f'{new_total}/{total}'
+    mentions = [f'<@{uid}>' for uid in goal['participants'] if uid != user_id]
+    outbox.announce(interaction.channel, f'{interaction.user.name} recorded {exercise}: +{added_to_daily}. Total Progress: {status} for "{goal["name"]}".', mentions)
+    if newly_completed:
+        outbox.announce(interaction.channel, f'{interaction.user.name} has now completed a full workout for the day after recording!', mentions)
         if goal['completed_days'][user_id] >= goal['effective_days']:
-            await interaction.channel.send(f'@everyone Congratulations {interaction.user.mention} has completed the goal with {goal["completed_days"][user_id]} days! 🎉🎊🥳')
+            outbox.announce(interaction.channel, f'@everyone Congratulations {interaction.user.mention} has completed the goal with {goal["completed_days"][user_id]} days! 🎉🎊🥳')
+    return reply('Workout recorded!', ephemeral=True)
+
+# Adds {exercise: amount} to a user's day in one event, capped like /record_workout
+def batch_event(key, goal, user_id, amounts):
+    daily = goal['daily_progress'][user_id]
+    total = goal['total_progress'][user_id]
+    event = {'type': 'record_batch', 'key': key, 'user': user_id, 'daily': {}, 'total': {}}
+    added = {}
+    for ex, amount in amounts.items():
+        new_daily = min(daily[ex] + amount, goal['daily_targets'][ex])
+        added[ex] = new_daily - daily[ex]
+        event['daily'][ex] = new_daily
+        event['total'][ex] = min(total[ex] + added[ex], goal['exercises'][ex])
+    # One completion check for the whole batch
+    all_completed = goal['daily_progress'].reached(user_id, goal['daily_targets'], event['daily'])
+    if all_completed and goal['daily_credit'][user_id] < 1.0:
+        event['completed_days'] = goal['completed_days'][user_id] + 1.0 - goal['daily_credit'][user_id]
+        event['credit'] = 1.0
+    return event, added
+
+# Announcement lines for a committed event that completed the user's day
+def completion_lines(goal, user_id, name, mention, event):
+    if 'credit' not in event:
+        return []
+    lines = [f'{name} has now completed a full workout for the day after recording!']
+    if goal['completed_days'][user_id] >= goal['effective_days']:
+        lines.append(f'@everyone Congratulations {mention} has completed the goal with {goal["completed_days"][user_id]} days! 🎉🎊🥳')
+    return lines
+
+# /record_batch
+@tree.command(name='record_batch', description='Record several exercises at once, or import a CSV of entries for several people')
+@app_commands.describe(
+    entries='Comma-separated exercise:amount, e.g., situps:50,pushups:20',
+    file='CSV of user,exercise,amount rows, or a user column plus one column per exercise (server managers only)'
+)
+@metrics.timed
+async def record_batch(interaction: discord.Interaction, entries: str = None, file: discord.Attachment = None):
+    if file is not None:
+        await import_entries(interaction, file)
+        return
+    if not entries:
+        await interaction.response.send_message('Add exercise:amount pairs or attach a CSV file!', ephemeral=True)
+        return
+    key = channel_key(interaction)
+    async with goal_locks.hold(key):
+        await start_day_if_due(key)
+        response = record_entries(interaction, key, entries)
+    await interaction.response.send_message(response, ephemeral=True)
+
+# Parses and commits /record_batch entries under the goal's lock; returns the response
+def record_entries(interaction, key, entries):
+    goal = goals.get(key)
+    if not goal:
+        return 'No active goal!'
+    user_id = str(interaction.user.id)
+    if user_id not in goal['total_progress']:
+        return 'Not joined!'
+    amounts = {}
+    for pair in entries.split(','):
+        if ':' in pair:
+            ex, amount = pair.split(':', 1)
+            ex = ex.strip()
+            if ex not in goal['exercises']:
+                return f'Invalid exercise: {ex}!'
+            try:
+                amount = float(amount.strip())
+            except ValueError:
+                return f'Invalid amount for {ex}!'
+            if not math.isfinite(amount):
+                return f'Invalid amount for {ex}!'
+            if amount < 0:
+                return 'Amounts must be positive!'
+            amounts[ex] = amounts.get(ex, 0.0) + amount
+    if not amounts:
+        return 'Add at least one valid exercise:amount pair!'
+    event, added = batch_event(key, goal, user_id, amounts)
+    commit(event)
+    recorded = ', '.join(f'{ex}: +{format_amount(amount)}' for ex, amount in added.items())
+    lines = [f'{interaction.user.name} recorded {recorded} for "{goal["name"]}".']
+    lines += completion_lines(goal, user_id, interaction.user.name, interaction.user.mention, event)
+    mentions = [f'<@{uid}>' for uid in goal['participants'] if uid != user_id]
+    outbox.announce(interaction.channel, '\n'.join(lines), mentions)
+    return 'Workout recorded!'
+
+# CSV part of /record_batch: rows are totalled per person while the file streams in, then committed together
+async def import_entries(interaction, file):
+    key, goal = find_goal(interaction)
+    if not goal:
+        await interaction.response.send_message('No active goal!', ephemeral=True)
+        return
+    permissions = getattr(interaction.user, 'guild_permissions', None)
+    if permissions is None or not permissions.manage_guild:
+        await interaction.response.send_message('Only server managers can import entries for other people.', ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    importer = EntryImport(goal['participants'], goal['exercises'])
+    try:
+        await importer.read(fetch_lines(file.url))
+    except (aiohttp.ClientError, ValueError) as e:
+        await interaction.followup.send(f'Could not read {file.filename}: {e}', ephemeral=True)
+        return
+    async with goal_locks.hold(key):
+        await start_day_if_due(key)
+        if goals.get(key) is not goal:
+            await interaction.followup.send('The goal changed while the file was being read; nothing was recorded.', ephemeral=True)
+            return
+        lines = []
+        for user_id, amounts in importer.entries.items():
+            event, _ = batch_event(key, goal, user_id, amounts)
+            commit(event)
+            lines += completion_lines(goal, user_id, f'<@{user_id}>', f'<@{user_id}>', event)
+    people = len(importer.entries)
+    if people:
+        lines.insert(0, f'{interaction.user.name} imported workouts for {people} people into "{goal["name"]}".')
+        outbox.announce(interaction.channel, '\n'.join(lines), [f'<@{uid}>' for uid in importer.entries])
+    summary = f'Read {importer.rows} rows from {file.filename} and recorded workouts for {people} people.'
+    if importer.skipped:
+        summary += f' Skipped {importer.skipped} entries:\n' + '\n'.join(importer.problems)
+    await interaction.followup.send(summary[:2000], ephemeral=True)
 
 # /fix_progress
 @tree.command(name='fix_progress', description='Fix daily progress for an exercise (corrects count)')
@@ -205,85 +597,90 @@ async def record_workout(interaction: discord.Interaction, exercise: str, amount
     exercise='Exercise name',
     new_daily='New daily amount (will adjust total accordingly)'
 )
+@app_commands.autocomplete(exercise=exercise_autocomplete)
+@metrics.timed
+@serialized
 async def fix_progress(interaction: discord.Interaction, exercise: str, new_daily: float):
-    if not data['goal']:
-        await interaction.response.send_message('No active goal!', ephemeral=True)
-        return
-    goal = data['goal']
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal!', ephemeral=True)
     user_id = str(interaction.user.id)
     if user_id not in goal['total_progress'] or exercise not in goal['exercises']:
-        await interaction.response.send_message('Not joined or invalid exercise!', ephemeral=True)
-        return
+        return reply('Not joined or invalid exercise!', ephemeral=True)
     if new_daily < 0:
-        await interaction.response.send_message('New daily must be non-negative!', ephemeral=True)
-        return
+        return reply('New daily must be non-negative!', ephemeral=True)
     current_daily = goal['daily_progress'][user_id][exercise]
     daily_target = goal['daily_targets'][exercise]
     adjusted_new_daily = min(new_daily, daily_target)
     delta = adjusted_new_daily - current_daily
-    goal['daily_progress'][user_id][exercise] = adjusted_new_daily
     # Adjust total
     current_total = goal['total_progress'][user_id][exercise]
     total = goal['exercises'][exercise]
     new_total = max(min(current_total + delta, total), 0.0)
-    goal['total_progress'][user_id][exercise] = new_total
-    save_data(data)
+    commit({'type': 'fix', 'key': key, 'user': user_id, 'exercise': exercise, 'daily': adjusted_new_daily, 'total': new_total})
     status = 'Completed!' if new_total == total else f'{new_total}/{total}'
-    await interaction.response.send_message(f'Fixed {exercise} daily to {adjusted_new_daily}. New total: {status}', ephemeral=True)
+    return reply(f'Fixed {exercise} daily to {adjusted_new_daily}. New total: {status}', ephemeral=True)
 
 # /completed_full
 @tree.command(name='completed_full', description='Record full workout complete for the day')
+@metrics.timed
+@serialized
 async def completed_full(interaction: discord.Interaction):
-    if not data['goal']:
-        await interaction.response.send_message('No active goal!', ephemeral=True)
-        return
-    goal = data['goal']
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal!', ephemeral=True)
     user_id = str(interaction.user.id)
     if user_id not in goal['total_progress']:
-        await interaction.response.send_message('Not joined!', ephemeral=True)
-        return
+        return reply('Not joined!', ephemeral=True)
     current_credit = goal['daily_credit'][user_id]
     if current_credit >= 1.0:
-        await interaction.response.send_message('You have already completed a full day today!', ephemeral=True)
-        return
+        return reply('You have already completed a full day today!', ephemeral=True)
     add_credit = 1.0 - current_credit
+    daily_values = {}
+    total_values = {}
     for ex in goal['daily_targets']:
         daily_target = goal['daily_targets'][ex]
         # Set daily to max (target)
         current_daily = goal['daily_progress'][user_id][ex]
         new_daily = daily_target
         added_to_daily = new_daily - current_daily
-        goal['daily_progress'][user_id][ex] = new_daily
+        daily_values[ex] = new_daily
         # Update total
         current_total = goal['total_progress'][user_id][ex]
         total = goal['exercises'][ex]
-        new_total = min(current_total + added_to_daily, total)
-        goal['total_progress'][user_id][ex] = new_total
-    goal['completed_days'][user_id] += add_credit
-    goal['daily_credit'][user_id] = 1.0
-    save_data(data)
-    mention = ' '.join([f'<@{uid}>' for uid in goal['participants'] if uid != user_id])
-    await interaction.channel.send(f'{interaction.user.name} completed full workout for the day! {mention}')
+        total_values[ex] = min(current_total + added_to_daily, total)
+    commit({
+        'type': 'completed_full',
+        'key': key,
+        'user': user_id,
+        'daily': daily_values,
+        'total': total_values,
+        'completed_days': goal['completed_days'][user_id] + add_credit,
+        'credit': 1.0,
+    })
+    mentions = [f'<@{uid}>' for uid in goal['participants'] if uid != user_id]
+    outbox.announce(interaction.channel, f'{interaction.user.name} completed full workout for the day!', mentions)
     if goal['completed_days'][user_id] >= goal['effective_days']:
-        await interaction.channel.send(f'@everyone Congratulations {interaction.user.mention} has completed the goal with {goal["completed_days"][user_id]} days! 🎉🎊🥳')
-    await interaction.response.send_message('Full workout recorded!', ephemeral=True)
+        outbox.announce(interaction.channel, f'@everyone Congratulations {interaction.user.mention} has completed the goal with {goal["completed_days"][user_id]} days! 🎉🎊🥳')
+    return reply('Full workout recorded!', ephemeral=True)
 
 # /completed_half
 @tree.command(name='completed_half', description='Record half workout complete for the day')
+@metrics.timed
+@serialized
 async def completed_half(interaction: discord.Interaction):
-    if not data['goal']:
-        await interaction.response.send_message('No active goal!', ephemeral=True)
-        return
-    goal = data['goal']
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal!', ephemeral=True)
     user_id = str(interaction.user.id)
     if user_id not in goal['total_progress']:
-        await interaction.response.send_message('Not joined!', ephemeral=True)
-        return
+        return reply('Not joined!', ephemeral=True)
     current_credit = goal['daily_credit'][user_id]
     if current_credit >= 0.5:
-        await interaction.response.send_message('You have already completed at least half today! Use /completed_full if upgrading.', ephemeral=True)
-        return
+        return reply('You have already completed at least half today! Use /completed_full if upgrading.', ephemeral=True)
     add_credit = 0.5
+    daily_values = {}
+    total_values = {}
     for ex in goal['daily_targets']:
         daily_target = goal['daily_targets'][ex]
         add_amount = daily_target / 2
@@ -291,20 +688,25 @@ async def completed_half(interaction: discord.Interaction):
         current_daily = goal['daily_progress'][user_id][ex]
         new_daily = min(current_daily + add_amount, daily_target)
         added_to_daily = new_daily - current_daily
-        goal['daily_progress'][user_id][ex] = new_daily
+        daily_values[ex] = new_daily
         # Add to total
         current_total = goal['total_progress'][user_id][ex]
         total = goal['exercises'][ex]
-        new_total = min(current_total + added_to_daily, total)
-        goal['total_progress'][user_id][ex] = new_total
-    goal['completed_days'][user_id] += add_credit
-    goal['daily_credit'][user_id] = 0.5
-    save_data(data)
-    mention = ' '.join([f'<@{uid}>' for uid in goal['participants'] if uid != user_id])
-    await interaction.channel.send(f'{interaction.user.name} completed half workout for the day! {mention}')
+        total_values[ex] = min(current_total + added_to_daily, total)
+    commit({
+        'type': 'completed_half',
+        'key': key,
+        'user': user_id,
+        'daily': daily_values,
+        'total': total_values,
+        'completed_days': goal['completed_days'][user_id] + add_credit,
+        'credit': 0.5,
+    })
+    mentions = [f'<@{uid}>' for uid in goal['participants'] if uid != user_id]
+    outbox.announce(interaction.channel, f'{interaction.user.name} completed half workout for the day!', mentions)
     if goal['completed_days'][user_id] >= goal['effective_days']:
-        await interaction.channel.send(f'@everyone Congratulations {interaction.user.mention} has completed the goal with {goal["completed_days"][user_id]} days! 🎉🎊🥳')
-    await interaction.response.send_message('Half workout recorded!', ephemeral=True)
+        outbox.announce(interaction.channel, f'@everyone Congratulations {interaction.user.mention} has completed the goal with {goal["completed_days"][user_id]} days! 🎉🎊🥳')
+    return reply('Half workout recorded!', ephemeral=True)
 
 # /view_progress
 @tree.command(name='view_progress', description='View progress for the current goal')
@@ -313,90 +715,139 @@ async def completed_half(interaction: discord.Interaction):
     app_commands.Choice(name='Me', value='me'),
     app_commands.Choice(name='Everyone', value='everyone')
 ])
+@metrics.timed
 async def view_progress(interaction: discord.Interaction, scope: str):
-    if not data['goal']:
+    key, goal = find_goal(interaction)
+    if not goal:
         await interaction.response.send_message('No active goal!', ephemeral=True)
         return
-    goal = data['goal']
     user_id = str(interaction.user.id)
     if scope == 'me':
-        msg = await build_my_progress_message(goal, user_id)
+        msg = build_my_progress_message(goal, user_id)
     elif scope == 'everyone':
-        msg = await build_everyone_daily_message(goal)
+        msg = await build_everyone_daily_message(key, goal, interaction.guild)
     else:
         await interaction.response.send_message('Invalid scope! Use me or everyone.', ephemeral=True)
         return
     await interaction.response.send_message(msg, ephemeral=True)
 
+# /leaderboard
+@tree.command(name='leaderboard', description='Show who is ahead in the current goal')
+@app_commands.describe(top='How many participants to show (1-25, default 10)')
+@metrics.timed
+async def leaderboard(interaction: discord.Interaction, top: app_commands.Range[int, 1, 25] = 10):
+    key, goal = find_goal(interaction)
+    if not goal:
+        await interaction.response.send_message('No active goal!', ephemeral=True)
+        return
+    index = aggregates.get(key)
+    leaders = index.top(top)
+    usernames = await names.resolve([user_id for user_id, _, _ in leaders], interaction.guild)
+    msg = f'Leaderboard for "{goal["name"]}":\n'
+    for rank, (user_id, days, pct) in enumerate(leaders, 1):
+        msg += f'{rank}. {usernames[user_id]}: {format_amount(days)}/{goal["effective_days"]} days, {pct:.0f}% of total volume\n'
+    msg += 'Team totals:\n'
+    for ex, amount in index.team_totals.items():
+        msg += f'  {ex}: {format_amount(amount)}\n'
+    # Long names or many exercises can still pass Discord's message limit
+    await interaction.response.send_message(msg[:2000], ephemeral=True)
+
 # /view_goal
 @tree.command(name='view_goal', description='View the daily goals for the current goal')
+@metrics.timed
 async def view_goal(interaction: discord.Interaction):
-    if not data['goal']:
+    key, goal = find_goal(interaction)
+    if not goal:
         await interaction.response.send_message('No active goal!', ephemeral=True)
         return
-    goal = data['goal']
     msg = f'Current Goal "{goal["name"]}":\nDaily Goals:\n'
     for ex, amt in goal['daily_targets'].items():
         display_amt = int(amt) if amt % 1 == 0 else f'{amt:.1f}'
         msg += f'  {ex}: {display_amt}\n'
+    msg += f'Timezone: {goal_timezone(goal).zone}\n'
     await interaction.response.send_message(msg, ephemeral=True)
 
+# /set_timezone
+@tree.command(name='set_timezone', description="Set the timezone of the current goal's midnight reset and progress updates")
+@app_commands.describe(timezone='Timezone name, e.g., Europe/London')
+@app_commands.autocomplete(timezone=timezone_autocomplete)
+@metrics.timed
+@serialized
+async def set_timezone(interaction: discord.Interaction, timezone: str):
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal!', ephemeral=True)
+    if timezone not in pytz.all_timezones_set:
+        return reply(f'Unknown timezone "{timezone}"! Pick one from the list, e.g., Europe/London.', ephemeral=True)
+    tz = pytz.timezone(timezone)
+    event = {'type': 'set_timezone', 'key': key, 'timezone': timezone}
+    if 'last_reset' in goal:
+        # The same instant in the new zone; otherwise a move to a zone that is behind skips a reset
+        last_reset = goal_timezone(goal).localize(datetime.strptime(goal['last_reset'], '%Y-%m-%d %H:%M:%S'))
+        event['last_reset'] = last_reset.astimezone(tz).strftime('%Y-%m-%d %H:%M:%S')
+        # Today must not move back onto a date that is already recorded in the history
+        closed = (await history.rollup(key))['last_day']
+        if closed is not None and event['last_reset'][:10] <= closed:
+            return reply(f'In {timezone} it is still {event["last_reset"][:10]}, a day that has already been recorded. '
+                         f'Try again after midnight {timezone} time.', ephemeral=True)
+    commit(event)
+    return reply(f'Timezone for "{goal["name"]}" set to {timezone}. Today\'s progress is kept; the next reset is at midnight {timezone} time, with updates at 12:00 and 20:00.')
+
 # /delete_goal
 @tree.command(name='delete_goal', description='Delete the current goal')
+@metrics.timed
+@serialized
 async def delete_goal(interaction: discord.Interaction):
-    if not data['goal']:
-        await interaction.response.send_message('No active goal to delete!', ephemeral=True)
-        return
-    data['goal'] = None
-    save_data(data)
-    await interaction.response.send_message('Goal deleted!')
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal to delete!', ephemeral=True)
+    commit({'type': 'delete_goal', 'key': key})
+    history.archive(key)
+    return reply('Goal deleted!')
 
 # /list_participants
 @tree.command(name='list_participants', description='List who has joined the current goal')
+@metrics.timed
 async def list_participants(interaction: discord.Interaction):
-    if not data['goal']:
+    key, goal = find_goal(interaction)
+    if not goal:
         await interaction.response.send_message('No active goal!', ephemeral=True)
         return
-    goal = data['goal']
     msg = f'Participants in "{goal["name"]}":\n'
+    usernames = await names.resolve(goal['participants'], interaction.guild)
     for user_id in goal['participants']:
-        try:
-            user = await client.fetch_user(int(user_id))
-            msg += f'- {user.name}\n'
-        except:
-            msg += f'- Unknown User ({user_id})\n'
+        msg += f'- {usernames[user_id]}\n'
     await interaction.response.send_message(msg, ephemeral=True)
 
 # /claim_rest
 @tree.command(name='claim_rest', description='Claim a rest day')
+@metrics.timed
+@serialized
 async def claim_rest(interaction: discord.Interaction):
-    if not data['goal']:
-        await interaction.response.send_message('No active goal!', ephemeral=True)
-        return
-    goal = data['goal']
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal!', ephemeral=True)
     user_id = str(interaction.user.id)
     if user_id not in goal['rest_used']:
-        await interaction.response.send_message('Not joined!', ephemeral=True)
-        return
+        return reply('Not joined!', ephemeral=True)
     if goal['rest_used'][user_id] >= goal['rest']:
-        await interaction.response.send_message(f'No more rest days available for you! You have used {goal["rest_used"][user_id]} out of {goal["rest"]}.', ephemeral=True)
-        return
-    goal['rest_used'][user_id] += 1
-    save_data(data)
-    mention = f'{interaction.user.mention} ' + ' '.join([f'<@{uid}>' for uid in goal['participants'] if uid != user_id])
-    await interaction.channel.send(f'{interaction.user.name} claimed a rest day! Rest used for {interaction.user.name}: {goal["rest_used"][user_id]}/{goal["rest"]}. {mention}')
-    await interaction.response.send_message('Rest day claimed!')
+        return reply(f'No more rest days available for you! You have used {goal["rest_used"][user_id]} out of {goal["rest"]}.', ephemeral=True)
+    commit({'type': 'claim_rest', 'key': key, 'user': user_id, 'rest_used': goal['rest_used'][user_id] + 1})
+    mentions = [interaction.user.mention] + [f'<@{uid}>' for uid in goal['participants'] if uid != user_id]
+    outbox.announce(interaction.channel, f'{interaction.user.name} claimed a rest day! Rest used for {interaction.user.name}: {goal["rest_used"][user_id]}/{goal["rest"]}.', mentions)
+    return reply('Rest day claimed!')
 
 # /change_goal
 @tree.command(name='change_goal', description='Modify the current goal\'s daily targets (affects current day and forward)')
 @app_commands.describe(
     exercises='Comma-separated exercise:new_daily_target, e.g., situps:50,pushups:25'
 )
+@metrics.timed
+@serialized
 async def change_goal(interaction: discord.Interaction, exercises: str):
-    if not data['goal']:
-        await interaction.response.send_message('No active goal to modify!', ephemeral=True)
-        return
-    goal = data['goal']
+    key, goal = find_goal(interaction)
+    if not goal:
+        return reply('No active goal to modify!', ephemeral=True)
     new_daily_targets = {}
     changes_made = False
 
@@ -405,6 +856,8 @@ async def change_goal(interaction: discord.Interaction, exercises: str):
             ex, new_daily = pair.split(':')
             ex = ex.strip()
             new_daily = float(new_daily.strip())
+            if not math.isfinite(new_daily):
+                return reply(f'Invalid amount for {ex}!', ephemeral=True)
             if ex in goal['daily_targets']:
                 old_daily = goal['daily_targets'][ex]
                 if new_daily != old_daily:
@@ -412,28 +865,97 @@ async def change_goal(interaction: discord.Interaction, exercises: str):
                     changes_made = True
 
     if not changes_made:
-        await interaction.response.send_message('No valid changes detected! Use format exercise:new_daily_target.', ephemeral=True)
+        return reply('No valid changes detected! Use format exercise:new_daily_target.', ephemeral=True)
+
+    # Apply changes to daily targets only, capping current daily progress at the new targets
+    commit({'type': 'change_goal', 'key': key, 'targets': new_daily_targets})
+    changes = ', '.join([f"{ex}: {old_daily} → {new_daily}" for ex, new_daily in new_daily_targets.items()])
+    mentions = [f'<@{uid}>' for uid in goal['participants']]
+    outbox.announce(interaction.channel, f'Goal "{goal["name"]}" updated! New daily targets: {changes}. Affects today onward.', mentions)
+    return reply(f'Goal updated! Changed daily targets: {changes}. Affects current day and forward. Notify participants.', ephemeral=True)
+
+# /stats
+@tree.command(name='stats', description='Show streaks, weekly averages and consistency in the current goal')
+@app_commands.describe(user='Whose stats to show (default: you)')
+@metrics.timed
+async def show_stats(interaction: discord.Interaction, user: discord.User = None):
+    key, goal = find_goal(interaction)
+    if not goal:
+        await interaction.response.send_message('No active goal!', ephemeral=True)
         return
+    member = user or interaction.user
+    # Precomputed at each reset, so this is a lookup rather than a scan of the history
+    rollup = (await history.rollup(key))['users'].get(str(member.id))
+    if rollup is None:
+        await interaction.response.send_message(f'No finished days recorded for {member.name} yet. Days are added at the midnight reset.', ephemeral=True)
+        return
+    days = rollup['days']
+    weekly = ', '.join(f'{ex}: {format_amount(round(total * 7 / days, 1))}' for ex, total in rollup['totals'].items())
+    msg = f'Stats for {member.name} in "{goal["name"]}" ({days} days since {rollup["first_day"]}):\n'
+    msg += f'  Current streak: {rollup["streak"]} full days (best: {rollup["best_streak"]})\n'
+    msg += f'  Consistency: {rollup["full_days"] / days * 100:.0f}% of days fully completed ({rollup["full_days"]} full, {rollup["half_days"]} half, {rollup["rest_days"]} rest)\n'
+    msg += f'  Weekly average: {weekly}\n'
+    await interaction.response.send_message(msg, ephemeral=True)
 
-    # Apply changes to daily targets only
-    for ex, new_daily in new_daily_targets.items():
-        goal['daily_targets'][ex] = new_daily
+# /export_history
+@tree.command(name='export_history', description='Download the daily history of the current goal')
+@app_commands.describe(
+    file_type='CSV or JSON Lines (default CSV)',
+    days='Only the last N days (default: everything)'
+)
+@app_commands.choices(file_type=[
+    app_commands.Choice(name='CSV', value='csv'),
+    app_commands.Choice(name='JSON Lines', value='jsonl')
+])
+@metrics.timed
+async def export_history(interaction: discord.Interaction, file_type: str = 'csv', days: int = None):
+    key, goal = find_goal(interaction)
+    if not goal:
+        await interaction.response.send_message('No active goal!', ephemeral=True)
+        return
+    since = None
+    if days is not None:
+        if days < 1:
+            await interaction.response.send_message('Days must be at least 1!', ephemeral=True)
+            return
+        since = (datetime.now(goal_timezone(goal)) - timedelta(days=days)).strftime('%Y-%m-%d')
+    await interaction.response.defer(ephemeral=True)
+    # Written row by row to a temporary file in an executor, then uploaded from disk
+    fp = tempfile.TemporaryFile()
+    try:
+        rows = await asyncio.get_running_loop().run_in_executor(None, history.export, key, file_type, fp, since)
+        if not rows:
+            await interaction.followup.send('No finished days recorded yet. Days are added at the midnight reset.', ephemeral=True)
+            return
+        size = fp.tell()
+        limit = getattr(interaction.guild, 'filesize_limit', 8 * 1024 * 1024)
+        if size > limit:
+            await interaction.followup.send(f'The export is {size / 2 ** 20:.1f} MB, over the upload limit. Try fewer days.', ephemeral=True)
+            return
+        fp.seek(0)
+        await interaction.followup.send(f'History of "{goal["name"]}": {rows} daily entries.', file=discord.File(fp, filename=f'workout_history.{file_type}'), ephemeral=True)
+    finally:
+        fp.close()
 
-    # Adjust current daily progress for affected exercises
-    for user_id in goal['participants']:
-        for ex in new_daily_targets:
-            current_daily = goal['daily_progress'][user_id][ex]
-            new_daily_target = goal['daily_targets'][ex]
-            # Update daily progress to reflect new target (keep current progress if below, cap if above)
-            if current_daily > new_daily_target:
-                goal['daily_progress'][user_id][ex] = new_daily_target
-            # No change to total or past days, only daily target affects future capping
-
-    save_data(data)
-    changes = ', '.join([f"{ex}: {old_daily} → {new_daily}" for ex, new_daily in new_daily_targets.items()])
-    await interaction.response.send_message(f'Goal updated! Changed daily targets: {changes}. Affects current day and forward. Notify participants.', ephemeral=True)
-    mention = ' '.join([f'<@{uid}>' for uid in goal['participants']])
-    await interaction.channel.send(f'Goal "{goal["name"]}" updated! New daily targets: {changes}. Affects today onward. {mention}')
+# /bot_stats
+@tree.command(name='bot_stats', description='Show bot performance statistics (administrators only)')
+@app_commands.default_permissions(administrator=True)
+@metrics.timed
+async def bot_stats(interaction: discord.Interaction):
+    permissions = getattr(interaction.user, 'guild_permissions', None)
+    if permissions is None or not permissions.administrator:
+        await interaction.response.send_message('Only server administrators can use this command.', ephemeral=True)
+        return
+    summary = metrics.summary()
+    if len(summary) > 1990:
+        summary = summary[:1987] + '...'
+    await interaction.response.send_message(f'```\n{summary}\n```', ephemeral=True)
 
 # Run the bot with the token from the .env file
-client.run(os.getenv('DISCORD_TOKEN'))
+def main():
+    # Treat SIGTERM (docker stop) like Ctrl+C so pending writes get flushed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        client.run(os.getenv('DISCORD_TOKEN'))
+    finally:
+        store.flush_sync()
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import time
+
+import discord
+
+from storage import atomic_write
+
+
+def fingerprint(tree, guild=None):
+    # Hash of the command payloads tree.sync() would upload for this scope
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+                     key=lambda command: (command.get('type', 1), command['name']))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class CommandSync:
+    """Uploads application commands only when their definitions changed.
+
+    The fingerprint of what was last uploaded is kept in a small JSON file per
+    application and scope (global, or one entry per guild in `guild_ids`), so
+    restarts and reconnects with unchanged commands skip the upload. Guild
+    commands show up immediately; global ones can take a while to reach every
+    server. Delete the file to force a sync.
+    """
+
+    def __init__(self, tree, path, guild_ids=()):
+        self.tree = tree
+        self.path = path
+        self.guild_ids = list(guild_ids)
+        # Counters
+        self.synced = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_sync_latency = 0.0
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    async def sync(self):
+        state = self._load()
+        guilds = [discord.Object(id=guild_id) for guild_id in self.guild_ids] or [None]
+        start = time.perf_counter()
+        for guild in guilds:
+            if guild is not None:
+                self.tree.copy_global_to(guild=guild)
+            scope = f'{self.tree.client.application_id}:{guild.id if guild else "global"}'
+            digest = fingerprint(self.tree, guild)
+            if state.get(scope) == digest:
+                self.skipped += 1
+                continue
+            try:
+                await self.tree.sync(guild=guild)
+            except discord.HTTPException as e:
+                self.failures += 1
+                print(f'Failed to sync commands ({scope}): {e}')
+                continue
+            self.synced += 1
+            state[scope] = digest
+            atomic_write(self.path, json.dumps(state, indent=4).encode('utf-8'))
+        self.last_sync_latency = time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'synced': self.synced,
+            'skipped': self.skipped,
+            'failures': self.failures,
+            'last_sync_latency': self.last_sync_latency,
+        }
@@ -0,0 +1,102 @@
+import csv
+import math
+import re
+
+import aiohttp
+
+USER_ID = re.compile(r'^(?:<@!?)?(\d{15,25})>?$')
+
+
+async def fetch_lines(url):
+    # Yields the file's lines as they arrive instead of downloading it first
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                yield line
+
+
+def parse_user(cell):
+    match = USER_ID.match(cell.strip())
+    return match.group(1) if match else None
+
+
+class EntryImport:
+    """Per-user exercise totals collected from CSV rows, one row at a time.
+
+    Accepts either long rows (user,exercise,amount) or a wide sheet with a
+    user column followed by one column per exercise, each optionally under a
+    header row. Users are Discord IDs or mentions. Only the running totals
+    are kept, so memory grows with people and exercises, not rows.
+    """
+
+    def __init__(self, participants, exercises, max_problems=10):
+        self.participants = set(participants)
+        self.exercises = exercises
+        self.max_problems = max_problems
+        self.entries = {}
+        self.rows = 0
+        self.skipped = 0
+        self.problems = []
+        self._columns = None
+
+    def _skip(self, line_no, reason):
+        self.skipped += 1
+        if len(self.problems) < self.max_problems:
+            self.problems.append(f'line {line_no}: {reason}')
+
+    def _add(self, line_no, user_id, exercise, amount):
+        exercise = exercise.strip()
+        if exercise not in self.exercises:
+            self._skip(line_no, f'unknown exercise "{exercise}"')
+            return
+        try:
+            value = float(amount)
+        except ValueError:
+            self._skip(line_no, f'amount "{amount.strip()}" is not a number')
+            return
+        if not math.isfinite(value):
+            self._skip(line_no, f'amount "{amount.strip()}" is not a number')
+            return
+        if value < 0:
+            self._skip(line_no, 'negative amount')
+            return
+        user = self.entries.setdefault(user_id, {})
+        user[exercise] = user.get(exercise, 0.0) + value
+
+    def add_row(self, line_no, row):
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            return
+        user_id = parse_user(cells[0])
+        if user_id is None:
+            if line_no == 1:
+                # Header: long format if it names exercise/amount columns, otherwise exercise columns
+                lowered = [cell.lower() for cell in cells[1:]]
+                if lowered[:2] != ['exercise', 'amount']:
+                    self._columns = cells[1:]
+                return
+            self._skip(line_no, f'"{cells[0]}" is not a user ID or mention')
+            return
+        self.rows += 1
+        if user_id not in self.participants:
+            self._skip(line_no, f'<@{user_id}> has not joined the goal')
+            return
+        if self._columns is not None:
+            for exercise, amount in zip(self._columns, cells[1:]):
+                if amount:
+                    self._add(line_no, user_id, exercise, amount)
+        elif len(cells) >= 3:
+            self._add(line_no, user_id, cells[1], cells[2])
+        else:
+            self._skip(line_no, 'expected user,exercise,amount')
+
+    async def read(self, lines):
+        # lines: async iterable of bytes, e.g. fetch_lines(attachment.url)
+        line_no = 0
+        async for raw in lines:
+            line_no += 1
+            text = raw.decode('utf-8-sig' if line_no == 1 else 'utf-8', errors='replace')
+            for row in csv.reader([text]):
+                self.add_row(line_no, row)
+        return self.entries
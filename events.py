@@ -0,0 +1,110 @@
+# Typed state changes. Every command builds one of these with the values it
+# computed and hands it to commit(), which applies it here and logs it. The
+# journal replays the same events on startup, so they carry resulting values
+# (not deltas) and applying one twice is harmless.
+#
+# State is a dict of goals keyed by goal_key(guild_id, channel_id), and every
+# event names the goal it touches in event['key']. Each goal's daily and total
+# progress are ProgressTables (see progress.py), created here from the plain
+# dicts a create_goal event carries.
+
+from progress import compact_goal
+
+
+def goal_key(guild_id, channel_id):
+    # Goals created before multi-guild support have no guild and use 0
+    return f'{guild_id or 0}:{channel_id}'
+
+
+def _create_goal(goals, event):
+    goals[event['key']] = compact_goal(event['goal'])
+
+
+def _delete_goal(goals, event):
+    goals.pop(event['key'], None)
+
+
+def _move_goal(goals, event):
+    goals[event['new_key']] = goals.pop(event['key'])
+
+
+def _join(goals, event):
+    goal = goals[event['key']]
+    user_id = event['user']
+    if user_id in goal['participants']:
+        return
+    goal['participants'].append(user_id)
+    goal['total_progress'].add(user_id)
+    goal['daily_progress'].add(user_id)
+    goal['completed_days'][user_id] = 0.0
+    goal['daily_credit'][user_id] = 0.0
+    goal['rest_used'][user_id] = 0
+
+
+def _record(goals, event):
+    goal = goals[event['key']]
+    user_id = event['user']
+    goal['daily_progress'][user_id][event['exercise']] = event['daily']
+    goal['total_progress'][user_id][event['exercise']] = event['total']
+    if 'credit' in event:
+        goal['completed_days'][user_id] = event['completed_days']
+        goal['daily_credit'][user_id] = event['credit']
+
+
+def _record_many(goals, event):
+    # Several exercises at once; credit is only included when it changed
+    goal = goals[event['key']]
+    user_id = event['user']
+    goal['daily_progress'][user_id].update(event['daily'])
+    goal['total_progress'][user_id].update(event['total'])
+    if 'credit' in event:
+        goal['completed_days'][user_id] = event['completed_days']
+        goal['daily_credit'][user_id] = event['credit']
+
+
+def _claim_rest(goals, event):
+    goals[event['key']]['rest_used'][event['user']] = event['rest_used']
+
+
+def _change_goal(goals, event):
+    goal = goals[event['key']]
+    goal['daily_targets'].update(event['targets'])
+    # Cap today's progress at the new targets; totals and past days are untouched
+    for ex, target in event['targets'].items():
+        goal['daily_progress'].cap(ex, target)
+
+
+def _set_timezone(goals, event):
+    # last_reset comes converted to the new timezone, so resets keep comparing dates in one zone
+    goal = goals[event['key']]
+    goal['timezone'] = event['timezone']
+    if 'last_reset' in event:
+        goal['last_reset'] = event['last_reset']
+
+
+def _reset(goals, event):
+    goal = goals[event['key']]
+    goal['daily_progress'].fill(0.0)
+    goal['daily_credit'].update(dict.fromkeys(goal['participants'], 0.0))
+    goal['last_reset'] = event['at']
+
+
+APPLY = {
+    'create_goal': _create_goal,
+    'delete_goal': _delete_goal,
+    'move_goal': _move_goal,
+    'join': _join,
+    'record': _record,
+    'fix': _record,
+    'record_batch': _record_many,
+    'completed_full': _record_many,
+    'completed_half': _record_many,
+    'claim_rest': _claim_rest,
+    'change_goal': _change_goal,
+    'set_timezone': _set_timezone,
+    'reset': _reset,
+}
+
+
+def apply_event(goals, event):
+    APPLY[event['type']](goals, event)
@@ -0,0 +1,200 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import time
+import uuid
+
+from storage import append_lines, atomic_write
+
+ROLLUP_FILE = 'rollup.json'
+
+
+def roll(rollup, row):
+    """Fold one closed day of one user into their rollup, returning a new dict.
+
+    Streaks count consecutive fully completed days; a day on which the user
+    claimed a rest day neither extends nor breaks one.
+    """
+    if rollup is None:
+        rollup = {'first_day': row['day'], 'days': 0, 'full_days': 0, 'half_days': 0, 'rest_days': 0,
+                  'streak': 0, 'best_streak': 0, 'rest_used': 0, 'totals': {}}
+    rollup = dict(rollup, last_day=row['day'], days=rollup['days'] + 1)
+    rested = row['rest_used'] > rollup['rest_used']
+    rollup['rest_used'] = row['rest_used']
+    if row['credit'] >= 1.0:
+        rollup['full_days'] += 1
+        rollup['streak'] += 1
+        rollup['best_streak'] = max(rollup['best_streak'], rollup['streak'])
+    elif rested:
+        rollup['rest_days'] += 1
+    else:
+        if row['credit'] > 0.0:
+            rollup['half_days'] += 1
+        rollup['streak'] = 0
+    totals = dict(rollup['totals'])
+    for ex, amount in row['amounts'].items():
+        totals[ex] = totals.get(ex, 0.0) + amount
+    rollup['totals'] = totals
+    return rollup
+
+
+class History:
+    """Every goal's finished days, kept after the midnight reset clears them.
+
+    Each goal has a directory of append-only JSON Lines files, one per month,
+    with one row per participant per day; closing a day appends to the
+    current month and never rewrites earlier ones. Alongside them a
+    rollup.json holds per-user running totals, streaks and day counts, updated
+    as each day closes, so /stats reads one small record instead of scanning
+    the history. The rollup is rebuilt from the month files if it is missing.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._rollups = {}
+        # Counters
+        self.days_closed = 0
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.rollup_rebuilds = 0
+
+    def goal_dir(self, key):
+        return os.path.join(self.directory, key.replace(':', '_'))
+
+    def partitions(self, key, since=None):
+        # Month files oldest first; `since` (YYYY-MM-DD) skips whole months before it
+        directory = self.goal_dir(key)
+        try:
+            names = sorted(name for name in os.listdir(directory) if name.endswith('.jsonl'))
+        except FileNotFoundError:
+            return []
+        if since is not None:
+            names = [name for name in names if name[:7] >= since[:7]]
+        return [os.path.join(directory, name) for name in names]
+
+    def rows(self, key, since=None):
+        # Every recorded row of the goal, read one line at a time
+        for path in self.partitions(key, since):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        # Torn write at the tail from a crash
+                        continue
+                    if since is None or row['day'] >= since:
+                        yield row
+
+    def _read_rollup(self, key):
+        try:
+            with open(os.path.join(self.goal_dir(key), ROLLUP_FILE), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+        rollup = {'last_day': None, 'days': 0, 'users': {}}
+        for row in self.rows(key):
+            if rollup['last_day'] != row['day']:
+                if rollup['last_day'] is not None and row['day'] < rollup['last_day']:
+                    continue
+                rollup['last_day'] = row['day']
+                rollup['days'] += 1
+            rollup['users'][row['user']] = roll(rollup['users'].get(row['user']), row)
+        if rollup['days']:
+            self.rollup_rebuilds += 1
+        return rollup
+
+    async def rollup(self, key):
+        rollup = self._rollups.get(key)
+        if rollup is None:
+            rollup = self._rollups[key] = await asyncio.get_running_loop().run_in_executor(None, self._read_rollup, key)
+        return rollup
+
+    async def close_day(self, key, goal, day):
+        """Record `day`'s progress for every participant; call before the reset clears it.
+
+        Closing a day that is already recorded does nothing, so a reset that
+        is retried after a crash does not count the day twice.
+        """
+        rollup = await self.rollup(key)
+        if rollup['last_day'] is not None and day <= rollup['last_day']:
+            return
+        # Copy what is needed on the loop; building rows and writing happen in an executor
+        table = goal['daily_progress']
+        snapshot = (list(goal['participants']), list(table.exercises), dict(table.user_index), table.values[:],
+                    dict(goal['daily_credit']), dict(goal['rest_used']))
+        self._rollups[key] = await asyncio.get_running_loop().run_in_executor(None, self._close_day, key, day, rollup, snapshot)
+
+    def _close_day(self, key, day, rollup, snapshot):
+        participants, exercises, index, values, credit, rest_used = snapshot
+        width = len(exercises)
+        users = dict(rollup['users'])
+        lines = []
+        for user_id in participants:
+            offset = index[user_id] * width
+            row = {
+                'day': day,
+                'user': user_id,
+                'amounts': dict(zip(exercises, values[offset:offset + width])),
+                'credit': credit.get(user_id, 0.0),
+                'rest_used': rest_used.get(user_id, 0),
+            }
+            lines.append(json.dumps(row, separators=(',', ':')))
+            users[user_id] = roll(users.get(user_id), row)
+        rollup = {'last_day': day, 'days': rollup['days'] + 1, 'users': users}
+        directory = self.goal_dir(key)
+        if lines:
+            payload = ('\n'.join(lines) + '\n').encode('utf-8')
+            append_lines(os.path.join(directory, day[:7] + '.jsonl'), payload)
+            self.rows_written += len(lines)
+            self.bytes_written += len(payload)
+        atomic_write(os.path.join(directory, ROLLUP_FILE), json.dumps(rollup, separators=(',', ':')).encode('utf-8'))
+        self.days_closed += 1
+        return rollup
+
+    def export(self, key, fmt, fp, since=None):
+        # Writes the history to a binary file object row by row; returns the number of rows
+        text = io.TextIOWrapper(fp, encoding='utf-8', newline='')
+        count = 0
+        if fmt == 'csv':
+            writer = csv.writer(text)
+            writer.writerow(['day', 'user_id', 'exercise', 'amount', 'credit'])
+            for row in self.rows(key, since):
+                for ex, amount in row['amounts'].items():
+                    writer.writerow([row['day'], row['user'], ex, amount, row['credit']])
+                count += 1
+        else:
+            for row in self.rows(key, since):
+                text.write(json.dumps(row, separators=(',', ':')) + '\n')
+                count += 1
+        text.flush()
+        text.detach()
+        return count
+
+    def archive(self, key):
+        # A deleted goal's history is set aside so a new goal in the channel starts empty
+        self._rollups.pop(key, None)
+        directory = self.goal_dir(key)
+        if os.path.isdir(directory):
+            # The random part keeps two deletes within the same second apart
+            target = f'{directory}.{time.strftime("%Y%m%d%H%M%S")}.{uuid.uuid4().hex[:8]}'
+            try:
+                os.replace(directory, target)
+            except OSError as e:
+                print(f'Failed to archive the history of {key}: {e}')
+
+    def move(self, key, new_key):
+        self._rollups.pop(key, None)
+        directory = self.goal_dir(key)
+        if os.path.isdir(directory) and not os.path.exists(self.goal_dir(new_key)):
+            os.replace(directory, self.goal_dir(new_key))
+
+    def stats(self):
+        return {
+            'days_closed': self.days_closed,
+            'rows_written': self.rows_written,
+            'bytes_written': self.bytes_written,
+            'rollup_rebuilds': self.rollup_rebuilds,
+            'cached_rollups': len(self._rollups),
+        }
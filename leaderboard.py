@@ -0,0 +1,93 @@
+from bisect import bisect_left, insort
+
+from autocomplete import NameIndex
+
+
+def format_amount(val):
+    return int(val) if val % 1 == 0 else f'{val:.1f}'
+
+
+class GoalIndex:
+    """Aggregates for one goal, kept up to date event by event.
+
+    Holds per-exercise team totals, each participant's completion, a ranking
+    sorted by (completed days, completion %), the per-user fragments of the
+    everyone-progress report and the exercise names for autocomplete. An
+    event only recomputes the users it touched.
+    """
+
+    def __init__(self, goal):
+        self.exercise_index = NameIndex(goal['daily_targets'])
+        self.team_totals = {ex: 0.0 for ex in goal['exercises']}
+        self.completion = {}
+        self._contrib = {}
+        self._rank_keys = {}
+        self.ranking = []
+        self.fragments = {}
+        for user_id in goal['participants']:
+            self.update_user(goal, user_id)
+
+    def update_user(self, goal, user_id):
+        totals = goal['total_progress'][user_id]
+        # What this user last added to the team totals, as an array in exercise order
+        old = self._contrib.get(user_id)
+        for i, (ex, amount) in enumerate(totals.items()):
+            self.team_totals[ex] += amount - (old[i] if old else 0.0)
+        self._contrib[user_id] = totals.amounts()
+        # Volume done out of the whole goal, averaged over exercises
+        pct = sum(min(totals[ex] / target, 1.0) for ex, target in goal['exercises'].items() if target) / len(goal['exercises']) * 100
+        self.completion[user_id] = pct
+        key = (-goal['completed_days'][user_id], -pct, user_id)
+        old_key = self._rank_keys.get(user_id)
+        if old_key != key:
+            if old_key is not None:
+                del self.ranking[bisect_left(self.ranking, old_key)]
+            insort(self.ranking, key)
+            self._rank_keys[user_id] = key
+        self.fragments.pop(user_id, None)
+
+    def top(self, n):
+        return [(user_id, -days, -pct) for days, pct, user_id in self.ranking[:n]]
+
+    def fragment(self, goal, user_id):
+        # Everything in the user's report section except their name
+        fragment = self.fragments.get(user_id)
+        if fragment is None:
+            fragment = f' (Rest used: {goal["rest_used"].get(user_id, 0)}/{goal["rest"]} (Completed Days: {goal["completed_days"][user_id]}/{goal["effective_days"]})) :\n'
+            for ex, val in goal['daily_progress'][user_id].items():
+                fragment += f'  {ex}: {format_amount(val)}/{goal["daily_targets"][ex]}\n'
+            self.fragments[user_id] = fragment
+        return fragment
+
+
+class Aggregates:
+    """GoalIndex per goal key, fed the same events as the store."""
+
+    def __init__(self, goals):
+        self.indexes = {key: GoalIndex(goal) for key, goal in goals.items()}
+
+    def get(self, key):
+        return self.indexes.get(key)
+
+    def apply(self, goals, event):
+        # Called after the event has been applied to `goals`
+        kind = event['type']
+        key = event['key']
+        if kind == 'create_goal':
+            self.indexes[key] = GoalIndex(goals[key])
+        elif kind == 'delete_goal':
+            self.indexes.pop(key, None)
+        elif kind == 'move_goal':
+            self.indexes[event['new_key']] = self.indexes.pop(key)
+        elif kind in ('reset', 'change_goal'):
+            # Daily numbers or targets changed for everyone; totals and ranking did not
+            self.indexes[key].fragments.clear()
+            if kind == 'change_goal':
+                self.indexes[key].exercise_index = NameIndex(goals[key]['daily_targets'])
+        elif kind == 'set_timezone':
+            # Nothing ranked or cached depends on the timezone
+            return
+        elif kind == 'claim_rest':
+            self.indexes[key].fragments.pop(event['user'], None)
+        else:
+            self.indexes[key].update_user(goals[key], event['user'])
@@ -0,0 +1,62 @@
+import asyncio
+import functools
+import time
+from contextlib import asynccontextmanager
+
+
+class GoalLocks:
+    """One asyncio.Lock per goal key, created on demand and dropped when idle.
+
+    Everything that reads and then changes a goal holds its lock, so those
+    changes apply one at a time and in arrival order even if the work in
+    between awaits. Different goals never wait on each other.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        # Counters
+        self.acquired = 0
+        self.contended = 0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            lock = entry[0]
+            if lock.locked():
+                self.contended += 1
+            start = time.perf_counter()
+            async with lock:
+                self.acquired += 1
+                self.max_wait = max(self.max_wait, time.perf_counter() - start)
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def serialized(self, key_for):
+        # Decorator for command handlers: the handler runs under the lock of key_for(interaction)
+        # and returns its response as (content, send_message options), which is sent after release
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(interaction, *args, **kwargs):
+                async with self.hold(key_for(interaction)):
+                    response = await func(interaction, *args, **kwargs)
+                if response is not None:
+                    content, options = response
+                    await interaction.response.send_message(content, **options)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {
+            'held': len(self._locks),
+            'acquired': self.acquired,
+            'contended': self.contended,
+            'max_wait': self.max_wait,
+        }
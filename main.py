@@ -0,0 +1,9 @@
+from dotenv import load_dotenv
+
+# Load environment variables from .env file before the bot reads its settings
+load_dotenv()
+
+import bot  # noqa: E402
+
+if __name__ == '__main__':
+    bot.main()
@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds, Prometheus-style
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation (the max for the overflow bucket)
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """Command latency and event-loop lag histograms, plus the counters that
+    other components already keep in their stats().
+
+    Disabled unless a port is given: timed() then returns handlers unchanged
+    and nothing runs in the background. When enabled, the numbers are served
+    in the Prometheus text format at http://host:port/metrics.
+    """
+
+    def __init__(self, port=0, host='127.0.0.1', prefix='fitbot', lag_interval=0.5):
+        self.enabled = bool(port)
+        self.port = port
+        self.host = host
+        self.prefix = prefix
+        self.lag_interval = lag_interval
+        self.histograms = {}
+        self.errors = {}
+        self.sources = {}
+        self._lag_task = None
+        self._server = None
+
+    def observe(self, name, value, labels=''):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram()
+        histogram.observe(value)
+
+    def timed(self, func):
+        # Decorator for command handlers: records their latency under their function name
+        if not self.enabled:
+            return func
+        labels = f'command="{func.__name__}"'
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                self.errors[func.__name__] = self.errors.get(func.__name__, 0) + 1
+                raise
+            finally:
+                self.observe('command_seconds', time.perf_counter() - start, labels)
+        return wrapper
+
+    def add_source(self, name, stats):
+        # stats() returns a flat dict; its numeric values are exported as <prefix>_<name>_<key>
+        self.sources[name] = stats
+
+    async def _watch_loop(self):
+        # How late a timer fires is how long something else held the event loop
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            self.observe('loop_lag_seconds', max(time.perf_counter() - start - self.lag_interval, 0.0))
+
+    async def start(self):
+        if not self.enabled or self._server is not None:
+            return
+        self._lag_task = asyncio.create_task(self._watch_loop())
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def close(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+            path = request.split(b' ', 2)[1] if request.count(b' ') >= 2 else b''
+            if path.split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', self.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('ascii') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _numbers(self):
+        for source, stats in self.sources.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield f'{self.prefix}_{source}_{key}', value
+
+    def render(self):
+        lines = []
+        typed = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            metric = f'{self.prefix}_{name}'
+            if metric not in typed:
+                lines.append(f'# TYPE {metric} histogram')
+                typed.add(metric)
+            sep = ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{labels}{sep}le="+Inf"}} {histogram.count}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{metric}_sum{suffix} {histogram.sum}')
+            lines.append(f'{metric}_count{suffix} {histogram.count}')
+        if self.errors:
+            lines.append(f'# TYPE {self.prefix}_command_errors_total counter')
+            for command, count in sorted(self.errors.items()):
+                lines.append(f'{self.prefix}_command_errors_total{{command="{command}"}} {count}')
+        for metric, value in self._numbers():
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        # Short human-readable version for /bot_stats
+        lines = []
+        if self.enabled:
+            commands = sorted((labels.split('"')[1], h) for (name, labels), h in self.histograms.items() if name == 'command_seconds')
+            for command, h in commands:
+                lines.append(f'{command}: {h.count} calls, p50 {h.quantile(0.5) * 1000:.1f} ms, '
+                             f'p99 {h.quantile(0.99) * 1000:.1f} ms, errors {self.errors.get(command, 0)}')
+            lag = self.histograms.get(('loop_lag_seconds', ''))
+            if lag is not None:
+                lines.append(f'event loop lag: p99 {lag.quantile(0.99) * 1000:.1f} ms, max {lag.max * 1000:.1f} ms')
+        else:
+            lines.append('Latency histograms are off (set METRICS_PORT to enable).')
+        # One-off timings such as load, startup and reconnects are recorded either way
+        for (name, labels), h in sorted(self.histograms.items()):
+            if name not in ('command_seconds', 'loop_lag_seconds'):
+                lines.append(f'{name}: {h.count}x, avg {h.sum / h.count:.2f} s, max {h.max:.2f} s')
+        for source, stats in self.sources.items():
+            values = ', '.join(f'{key}={value:.3f}' if isinstance(value, float) else f'{key}={value}'
+                               for key, value in stats().items())
+            lines.append(f'{source}: {values}')
+        return '\n'.join(lines)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class NameCache:
+    """User name lookups with a TTL and LRU eviction.
+
+    Misses are looked up in discord.py's own caches first (client.get_user and
+    the guild's member cache); only what is left goes to the REST API, fetched
+    concurrently with at most `concurrency` requests in flight.
+    """
+
+    def __init__(self, client, ttl=3600, max_size=10000, concurrency=8):
+        self.client = client
+        self.ttl = ttl
+        self.max_size = max_size
+        self._names = OrderedDict()
+        self._fetch_limit = asyncio.Semaphore(concurrency)
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.gateway_hits = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.fetch_seconds = 0.0
+
+    def remember(self, user):
+        self._store(str(user.id), user.name)
+
+    def _store(self, user_id, name):
+        self._names[user_id] = (name, time.monotonic() + self.ttl)
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    def _cached(self, user_id):
+        entry = self._names.get(user_id)
+        if entry is None:
+            return None
+        name, expires = entry
+        if expires < time.monotonic():
+            del self._names[user_id]
+            return None
+        self._names.move_to_end(user_id)
+        return name
+
+    def _from_gateway(self, user_id, guild):
+        user = self.client.get_user(int(user_id))
+        if user is None and guild is not None:
+            user = guild.get_member(int(user_id))
+        return user.name if user is not None else None
+
+    async def _fetch(self, user_id):
+        async with self._fetch_limit:
+            self.fetches += 1
+            start = time.perf_counter()
+            try:
+                user = await self.client.fetch_user(int(user_id))
+            except Exception:
+                self.fetch_errors += 1
+                return None
+            finally:
+                self.fetch_seconds += time.perf_counter() - start
+        self._store(user_id, user.name)
+        return user.name
+
+    async def resolve(self, user_ids, guild=None):
+        # Returns {user_id: name} for every id, falling back to 'Unknown User (id)'
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self._cached(user_id)
+            if name is not None:
+                self.hits += 1
+                names[user_id] = name
+                continue
+            self.misses += 1
+            name = self._from_gateway(user_id, guild)
+            if name is not None:
+                self.gateway_hits += 1
+                self._store(user_id, name)
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            for user_id, name in zip(missing, fetched):
+                names[user_id] = name if name is not None else f'Unknown User ({user_id})'
+        return names
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._names),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'gateway_hits': self.gateway_hits,
+            'fetches': self.fetches,
+            'fetch_errors': self.fetch_errors,
+            'fetch_seconds': self.fetch_seconds,
+        }
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+MESSAGE_LIMIT = 2000
+
+
+def split_long(text, limit):
+    # Break one oversized line on spaces, or anywhere if it has none
+    pieces = []
+    while len(text) > limit:
+        cut = text.rfind(' ', 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip(' ')
+    pieces.append(text)
+    return pieces
+
+
+def chunk_message(lines, mentions, limit=MESSAGE_LIMIT):
+    """Join announcement lines plus one mention line into messages of at most
+    `limit` characters, splitting between lines where possible."""
+    if mentions:
+        lines = list(lines) + [' '.join(mentions)]
+    chunks = []
+    current = ''
+    for line in lines:
+        for piece in split_long(line, limit):
+            if current and len(current) + 1 + len(piece) > limit:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f'{current}\n{piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class Outbox:
+    """Per-channel queue for announcements.
+
+    announce() returns immediately, so interaction responses never wait on a
+    channel send. Announcements for a channel that arrive within `window`
+    seconds of each other go out as one message, with mentions de-duplicated
+    onto a final line and the result split at Discord's 2000-character limit.
+    Each channel has at most one send in flight.
+    """
+
+    def __init__(self, window=2.0, limit=MESSAGE_LIMIT):
+        self.window = window
+        self.limit = limit
+        self._queues = {}
+        self._tasks = {}
+        self._closing = None
+        # Counters
+        self.queued = 0
+        self.batches = 0
+        self.messages_sent = 0
+        self.send_failures = 0
+        self.send_seconds = 0.0
+
+    def announce(self, channel, text, mentions=()):
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = {'channel': channel, 'lines': [], 'mentions': {}}
+        queue['lines'].append(text)
+        for mention in mentions:
+            queue['mentions'][mention] = None
+        self.queued += 1
+        if channel.id not in self._tasks:
+            self._tasks[channel.id] = asyncio.create_task(self._drain(channel.id))
+
+    async def _wait_window(self):
+        if self._closing is None:
+            self._closing = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._closing.wait(), timeout=self.window)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _drain(self, channel_id):
+        try:
+            while True:
+                await self._wait_window()
+                queue = self._queues.pop(channel_id, None)
+                if queue is None:
+                    return
+                self.batches += 1
+                for chunk in chunk_message(queue['lines'], list(queue['mentions']), self.limit):
+                    start = time.perf_counter()
+                    try:
+                        await queue['channel'].send(chunk)
+                        self.messages_sent += 1
+                    except Exception as e:
+                        self.send_failures += 1
+                        print(f'Failed to send to channel {channel_id}: {e}')
+                    self.send_seconds += time.perf_counter() - start
+        finally:
+            self._tasks.pop(channel_id, None)
+
+    async def close(self):
+        # Send everything still queued without waiting out the window
+        if self._closing is None:
+            self._closing = asyncio.Event()
+        self._closing.set()
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'pending': sum(len(queue['lines']) for queue in self._queues.values()),
+            'channels_pending': len(self._queues),
+            'batches': self.batches,
+            'merged': self.queued - self.batches - sum(len(queue['lines']) for queue in self._queues.values()),
+            'messages_sent': self.messages_sent,
+            'send_failures': self.send_failures,
+            'send_seconds': self.send_seconds,
+        }
@@ -0,0 +1,173 @@
+import base64
+import json
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Mapping, MutableMapping
+from operator import ge
+
+PROGRESS_FIELDS = ('daily_progress', 'total_progress')
+
+
+class ProgressRow(MutableMapping):
+    """One participant's {exercise: amount}, read and written through to the table."""
+
+    __slots__ = ('_table', '_offset')
+
+    def __init__(self, table, offset):
+        self._table = table
+        self._offset = offset
+
+    def __getitem__(self, exercise):
+        return self._table.values[self._offset + self._table.exercise_index[exercise]]
+
+    def __setitem__(self, exercise, amount):
+        self._table.values[self._offset + self._table.exercise_index[exercise]] = amount
+
+    def __delitem__(self, exercise):
+        raise TypeError('exercises cannot be removed from a progress row')
+
+    def __iter__(self):
+        return iter(self._table.exercises)
+
+    def __len__(self):
+        return len(self._table.exercises)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def amounts(self):
+        # Copy of the row's values, in exercise order
+        width = len(self._table.exercises)
+        return self._table.values[self._offset:self._offset + width]
+
+
+class ProgressTable(Mapping):
+    """{user_id: {exercise: amount}} for one goal, stored as a single flat array.
+
+    Participants and exercises get dense indices in the order they were
+    added, and every amount is a double at values[user * width + exercise].
+    It reads like the nested dicts it replaces, so goal['daily_progress']
+    [user_id][exercise] still works, but a reset is one fill instead of a new
+    dict per participant and a snapshot is the raw array.
+    """
+
+    def __init__(self, exercises, users=(), values=None):
+        self.exercises = list(exercises)
+        self.exercise_index = {ex: i for i, ex in enumerate(self.exercises)}
+        self.users = list(users)
+        self.user_index = {user_id: i for i, user_id in enumerate(self.users)}
+        if values is None:
+            values = array('d', bytes(8 * len(self.users) * len(self.exercises)))
+        self.values = values
+
+    def _offset(self, user_id):
+        return self.user_index[user_id] * len(self.exercises)
+
+    def __getitem__(self, user_id):
+        return ProgressRow(self, self._offset(user_id))
+
+    def __setitem__(self, user_id, amounts):
+        self.add(user_id)
+        self[user_id].update(amounts)
+
+    def __contains__(self, user_id):
+        return user_id in self.user_index
+
+    def __iter__(self):
+        return iter(self.users)
+
+    def __len__(self):
+        return len(self.users)
+
+    def __repr__(self):
+        return f'ProgressTable({self.to_dict()!r})'
+
+    def add(self, user_id):
+        # New participants start at zero for every exercise
+        if user_id not in self.user_index:
+            self.user_index[user_id] = len(self.users)
+            self.users.append(user_id)
+            self.values.frombytes(bytes(8 * len(self.exercises)))
+
+    def fill(self, amount=0.0):
+        if amount == 0.0:
+            self.values = array('d', bytes(8 * len(self.values)))
+        else:
+            self.values = array('d', [amount]) * len(self.values)
+
+    def cap(self, exercise, limit):
+        # Lower every participant's amount for one exercise to at most `limit`, writing only those above it
+        values = self.values
+        for i in range(self.exercise_index[exercise], len(values), len(self.exercises)):
+            if values[i] > limit:
+                values[i] = limit
+
+    def reached(self, user_id, targets, pending=None):
+        # Whether every exercise is at its target, counting `pending` {exercise: amount} instead of the stored amounts
+        row = self[user_id].amounts()
+        if pending:
+            for ex, amount in pending.items():
+                row[self.exercise_index[ex]] = amount
+        return all(map(ge, row, map(targets.__getitem__, self.exercises)))
+
+    def to_dict(self):
+        width = len(self.exercises)
+        return {user_id: dict(zip(self.exercises, self.values[i * width:(i + 1) * width]))
+                for i, user_id in enumerate(self.users)}
+
+    @classmethod
+    def from_dict(cls, progress, exercises):
+        table = cls(exercises, progress)
+        for user_id, amounts in progress.items():
+            table[user_id].update(amounts)
+        return table
+
+    def to_bytes(self):
+        # Little-endian: 4-byte header length, JSON header with the indices, then the doubles
+        header = json.dumps({'exercises': self.exercises, 'users': self.users}, separators=(',', ':')).encode('utf-8')
+        values = self.values
+        if sys.byteorder != 'little':
+            values = array('d', values)
+            values.byteswap()
+        return struct.pack('<I', len(header)) + header + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        (length,) = struct.unpack_from('<I', blob)
+        header = json.loads(blob[4:4 + length])
+        values = array('d')
+        values.frombytes(blob[4 + length:])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return cls(header['exercises'], header['users'], values)
+
+
+def compact_goal(goal):
+    # Replace a goal's progress dicts (or packed blobs) with tables, in place
+    for field in PROGRESS_FIELDS:
+        progress = goal[field]
+        if isinstance(progress, ProgressTable):
+            continue
+        if '__array__' in progress:
+            goal[field] = ProgressTable.from_bytes(zlib.decompress(base64.b64decode(progress['__array__'])))
+        else:
+            goal[field] = ProgressTable.from_dict(progress, goal['exercises'])
+    return goal
+
+
+def to_json(obj):
+    # json.dumps default= hook: progress as plain nested dicts, the import/export format
+    if isinstance(obj, ProgressTable):
+        return obj.to_dict()
+    if isinstance(obj, ProgressRow):
+        return dict(obj)
+    raise TypeError(f'{type(obj).__name__} is not JSON serializable')
+
+
+def packed(obj):
+    # json.dumps default= hook for snapshots: progress as a compressed binary blob
+    if isinstance(obj, ProgressTable):
+        return {'__array__': base64.b64encode(zlib.compress(obj.to_bytes())).decode('ascii')}
+    return to_json(obj)
@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, time as dtime, timedelta
+
+import pytz
+
+# Upper bound on one sleep, so a wall-clock jump (NTP, suspend) is noticed within the hour
+MAX_SLEEP = 3600
+
+
+def local_time(tz, day, hour, minute):
+    """The instant `hour:minute` happens on `day` in `tz`, across DST changes.
+
+    A time repeated when clocks fall back resolves to its first occurrence; a
+    time skipped when they spring forward moves to just after the gap.
+    """
+    naive = datetime.combine(day, dtime(hour, minute))
+    try:
+        return tz.localize(naive, is_dst=None)
+    except pytz.AmbiguousTimeError:
+        return tz.localize(naive, is_dst=True)
+    except pytz.NonExistentTimeError:
+        return tz.normalize(tz.localize(naive, is_dst=False))
+
+
+class DailyJob:
+    def __init__(self, name, hour, minute, callback, tz, catch_up=False):
+        self.name = name
+        self.hour = hour
+        self.minute = minute
+        self.callback = callback
+        self.tz = tz
+        self.catch_up = catch_up
+
+    def next_after(self, moment):
+        # First occurrence strictly after `moment` (an aware datetime)
+        day = moment.astimezone(self.tz).date()
+        while True:
+            candidate = local_time(self.tz, day, self.hour, self.minute)
+            if candidate > moment:
+                return candidate
+            day += timedelta(days=1)
+
+
+class OneShotJob:
+    def __init__(self, name, when, callback):
+        self.name = name
+        self.when = when
+        self.callback = callback
+        # An overdue one-off job is simply at the top of the heap
+        self.catch_up = False
+
+    def next_after(self, moment):
+        return None
+
+
+class Scheduler:
+    """Runs jobs from a heap of deadlines, sleeping until the earliest one.
+
+    Daily jobs are computed in the wall time of their timezone (the
+    configured one unless given), so they follow DST changes. Jobs with
+    catch_up=True also run once at start, with a deadline of None, for work
+    that may have been missed while the bot was down. Each due job runs in
+    its own task, so one that takes a while never holds up another's deadline.
+    """
+
+    def __init__(self, tz):
+        self.tz = tz
+        self._heap = []
+        self._seq = itertools.count()
+        self._wake = None
+        self._cancelled = set()
+        self._running = set()
+        # Counters
+        self.wakeups = 0
+        self.runs = 0
+        self.failures = 0
+        self.max_lateness = 0.0
+
+    def _push(self, when, job):
+        heapq.heappush(self._heap, (when.timestamp(), next(self._seq), when, job))
+        if self._wake is not None:
+            self._wake.set()
+
+    def now(self):
+        return datetime.now(pytz.utc)
+
+    def add_daily(self, name, hour, minute, callback, catch_up=False, tz=None):
+        job = DailyJob(name, hour, minute, callback, tz or self.tz, catch_up)
+        self._push(job.next_after(self.now()), job)
+        return job
+
+    def schedule_at(self, name, when, callback):
+        # One-off job, e.g. a reminder; `when` is an aware datetime
+        job = OneShotJob(name, when, callback)
+        self._push(when, job)
+        return job
+
+    def cancel(self, job):
+        self._cancelled.add(job)
+
+    def next_deadline(self):
+        while self._heap and self._heap[0][3] in self._cancelled:
+            self._cancelled.discard(heapq.heappop(self._heap)[3])
+        return self._heap[0][2] if self._heap else None
+
+    async def _run_job(self, job, deadline):
+        self.runs += 1
+        try:
+            await job.callback(deadline)
+        except Exception as e:
+            self.failures += 1
+            print(f'Scheduled job {job.name} failed: {e}')
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        for _, _, _, job in sorted(self._heap):
+            if job.catch_up and job not in self._cancelled:
+                await self._run_job(job, None)
+        while True:
+            deadline = self.next_deadline()
+            delay = MAX_SLEEP if deadline is None else min(deadline.timestamp() - time.time(), MAX_SLEEP)
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeups += 1
+                continue
+            _, _, deadline, job = heapq.heappop(self._heap)
+            self.max_lateness = max(self.max_lateness, -delay)
+            # Reschedule from the deadline, not from now, so a late wakeup never skips or repeats a day
+            following = job.next_after(deadline)
+            if following is not None:
+                self._push(following, job)
+            task = asyncio.create_task(self._run_job(job, deadline))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def stats(self):
+        deadline = self.next_deadline()
+        return {
+            'jobs': len(self._heap),
+            'next_deadline': deadline.isoformat() if deadline else None,
+            'wakeups': self.wakeups,
+            'runs': self.runs,
+            'running': len(self._running),
+            'failures': self.failures,
+            'max_lateness': self.max_lateness,
+        }
@@ -0,0 +1,757 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import date
+
+from events import apply_event, goal_key
+from progress import ProgressTable, compact_goal, packed, to_json
+
+
+def atomic_write(path, payload):
+    # Write to a temp file in the same directory, then rename over the target
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def write_shards(writes):
+    # (path, payload) pairs; a payload of None deletes the file
+    for path, payload in writes:
+        if payload is None:
+            remove(path)
+        else:
+            atomic_write(path, payload)
+
+
+def shard_dir_for(path):
+    return os.path.splitext(path)[0] + '_goals'
+
+
+def read_json_goals(path):
+    """Read goals from a JSON store: its shard directory if present, else the
+    pre-multi-guild single file. Returns (goals, imported_from_legacy)."""
+    goals = {}
+    shard_dir = shard_dir_for(path)
+    if os.path.isdir(shard_dir):
+        for name in os.listdir(shard_dir):
+            if name.endswith('.json') and not name.startswith('.'):
+                with open(os.path.join(shard_dir, name), 'r') as f:
+                    shard = json.load(f)
+                goals[shard['key']] = shard
+        return goals, False
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            legacy = json.load(f)
+        goal = legacy.get('goal')
+        if goal:
+            goals[goal_key(0, goal['channel_id'])] = {'key': goal_key(0, goal['channel_id']), 'goal': goal}
+    return goals, True
+
+
+class JsonStore:
+    """Write-behind store with one JSON file per goal.
+
+    Commands call append(event) instead of saving; a background task coalesces
+    those into one atomic write per changed goal `flush_interval` seconds after
+    the first change, or sooner once `max_dirty` changes are pending; with
+    nothing pending the task sleeps until the next change. Goals live in
+    `<path without .json>_goals/`, so a change only rewrites its own goal.
+    """
+
+    def __init__(self, path, flush_interval=5.0, max_dirty=50):
+        self.path = path
+        self.shard_dir = shard_dir_for(path)
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.goals = None
+        self.dirty = 0
+        self._dirty_keys = set()
+        self._wake = None
+        self._task = None
+        self._lock = None
+        # Counters
+        self.flushes = 0
+        self.coalesced_writes = 0
+        self.shards_written = 0
+        self.bytes_written = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def shard_path(self, key, ext='.json'):
+        return os.path.join(self.shard_dir, key.replace(':', '_') + ext)
+
+    def load(self):
+        shards, legacy = read_json_goals(self.path)
+        self.goals = {}
+        for key, shard in shards.items():
+            self._load_shard(key, shard)
+        if legacy:
+            # Split the old single-goal file into shards once
+            os.makedirs(self.shard_dir, exist_ok=True)
+            write_shards([(self.shard_path(key), self._serialize(key)) for key in self.goals])
+            if self.goals:
+                print(f'Imported {self.path} into {self.shard_dir}')
+        return self.goals
+
+    def _load_shard(self, key, shard):
+        self.goals[key] = compact_goal(shard['goal'])
+
+    def _serialize(self, key):
+        return json.dumps({'key': key, 'goal': self.goals[key]}, separators=(',', ':'), default=to_json).encode('utf-8')
+
+    def mark_dirty(self):
+        # The first change starts the save interval; reaching max_dirty saves at once
+        self.dirty += 1
+        if self._wake is not None and (self.dirty == 1 or self.dirty >= self.max_dirty):
+            self._wake.set()
+
+    def append(self, event):
+        # Each goal file is rewritten whole, so an event only marks its goal dirty
+        self._dirty_keys.add(event['key'])
+        if 'new_key' in event:
+            self._dirty_keys.add(event['new_key'])
+        self.mark_dirty()
+
+    def _collect(self):
+        keys = self._dirty_keys
+        self._dirty_keys = set()
+        # Serialize on the loop so each snapshot is consistent; write in an executor
+        writes = [(self.shard_path(key), self._serialize(key) if key in self.goals else None) for key in keys]
+        return keys, writes
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            if not self.dirty:
+                # Nothing to save: sleep until the next change instead of waking every interval
+                await self._wake.wait()
+            self._wake.clear()
+            if self.dirty < self.max_dirty:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f'Failed to save {self.shard_dir}: {e}')
+
+    def _get_lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        async with self._get_lock():
+            pending = self.dirty
+            if not pending:
+                return
+            keys, writes = self._collect()
+            self.dirty = 0
+            start = time.perf_counter()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, write_shards, writes)
+            except BaseException:
+                self.dirty += pending
+                self._dirty_keys |= keys
+                raise
+            self._record_flush(pending, writes, time.perf_counter() - start)
+
+    def flush_sync(self):
+        # Used at shutdown once the event loop is gone
+        if not self.dirty:
+            return
+        pending = self.dirty
+        keys, writes = self._collect()
+        start = time.perf_counter()
+        write_shards(writes)
+        self.dirty = 0
+        self._record_flush(pending, writes, time.perf_counter() - start)
+
+    def _record_flush(self, pending, writes, latency):
+        self.flushes += 1
+        self.coalesced_writes += max(pending - len(writes), 0)
+        self.shards_written += len(writes)
+        self.bytes_written += sum(len(payload) for _, payload in writes if payload is not None)
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.total_flush_latency += latency
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            'goals': len(self.goals or ()),
+            'pending_changes': self.dirty,
+            'flushes': self.flushes,
+            'coalesced_writes': self.coalesced_writes,
+            'shards_written': self.shards_written,
+            'bytes_written': self.bytes_written,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency,
+            'avg_flush_latency': self.total_flush_latency / self.flushes if self.flushes else 0.0,
+            'total_flush_latency': self.total_flush_latency,
+        }
+
+
+def append_lines(path, payload):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'ab') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def truncate(path):
+    with open(path, 'wb') as f:
+        os.fsync(f.fileno())
+
+
+def append_journals(writes):
+    for path, payload in writes:
+        append_lines(path, payload)
+
+
+def compact_shards(writes):
+    # (snapshot path, journal path, payload); a payload of None drops the goal.
+    # The snapshot goes first: a crash in between leaves a journal tail that is
+    # either skipped (older than the snapshot) or replays onto a missing goal.
+    for snapshot_path, journal_path, payload in writes:
+        if payload is None:
+            remove(snapshot_path)
+            remove(journal_path)
+        else:
+            atomic_write(snapshot_path, payload)
+            truncate(journal_path)
+
+
+class JournalStore(JsonStore):
+    """Append-only event journal with periodic snapshots, per goal.
+
+    Each event costs one JSON line in its goal's `.journal` file. Once
+    `snapshot_every` events have accumulated for a goal, that goal is written
+    to its snapshot (same format as JsonStore, plus the journal sequence number
+    it covers) and its journal is truncated. Startup loads the snapshots and
+    replays each journal's tail.
+    """
+
+    def __init__(self, path, snapshot_every=1000, **kwargs):
+        super().__init__(path, **kwargs)
+        self.snapshot_every = snapshot_every
+        self.seqs = {}
+        self.journal_events = {}
+        self._pending = {}
+        # Counters
+        self.snapshots = 0
+        self.replayed_events = 0
+        self.last_snapshot_latency = 0.0
+
+    def _load_shard(self, key, shard):
+        super()._load_shard(key, shard)
+        self.seqs[key] = shard.get('journal_seq', 0)
+
+    def _serialize(self, key):
+        # Snapshots keep progress as a compressed binary array; the journal has the readable history
+        shard = {'key': key, 'goal': self.goals[key], 'journal_seq': self.seqs.get(key, 0)}
+        return json.dumps(shard, separators=(',', ':'), default=packed).encode('utf-8')
+
+    def load(self):
+        super().load()
+        self.journal_events = {}
+        names = os.listdir(self.shard_dir) if os.path.isdir(self.shard_dir) else []
+        for name in names:
+            if not name.endswith('.journal'):
+                continue
+            with open(os.path.join(self.shard_dir, name), 'r') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Torn write at the tail from a crash; nothing after it was acknowledged
+                        break
+                    key = event['key']
+                    self.journal_events[key] = self.journal_events.get(key, 0) + 1
+                    if event['seq'] <= self.seqs.get(key, 0):
+                        continue
+                    self.seqs[key] = event['seq']
+                    if event['type'] != 'create_goal' and key not in self.goals:
+                        continue
+                    apply_event(self.goals, event)
+                    self.replayed_events += 1
+        return self.goals
+
+    def _log(self, event):
+        key = event['key']
+        self.seqs[key] = self.seqs.get(key, 0) + 1
+        # Serialize now: the event may share dicts with live state
+        line = json.dumps(dict(event, seq=self.seqs[key]), separators=(',', ':'), default=to_json) + '\n'
+        self._pending.setdefault(key, []).append(line)
+        self.mark_dirty()
+
+    def append(self, event):
+        if event['type'] == 'move_goal':
+            # Journals are per goal, so a move is logged as delete + create
+            new_key = event['new_key']
+            self._log({'type': 'delete_goal', 'key': event['key']})
+            self._log({'type': 'create_goal', 'key': new_key, 'goal': self.goals[new_key]})
+        else:
+            self._log(event)
+
+    def _take_pending(self):
+        pending = self._pending
+        self._pending = {}
+        self.dirty = 0
+        writes = [(self.shard_path(key, '.journal'), ''.join(lines).encode('utf-8')) for key, lines in pending.items()]
+        return pending, writes
+
+    def _count_flushed(self, pending):
+        for key, lines in pending.items():
+            self.journal_events[key] = self.journal_events.get(key, 0) + len(lines)
+
+    def _due_for_snapshot(self, keys):
+        return [key for key in keys
+                if key not in self.goals or self.journal_events.get(key, 0) >= self.snapshot_every]
+
+    def _collect_snapshots(self, keys):
+        # Snapshots cover every event up to seqs[key], including ones still
+        # pending; those get skipped on replay since their seq is not newer
+        return [(self.shard_path(key), self.shard_path(key, '.journal'),
+                 self._serialize(key) if key in self.goals else None) for key in keys]
+
+    async def flush(self):
+        if not self._pending:
+            return
+        async with self._get_lock():
+            if not self._pending:
+                return
+            pending, writes = self._take_pending()
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, append_journals, writes)
+            except BaseException:
+                for key, lines in pending.items():
+                    self._pending[key] = lines + self._pending.get(key, [])
+                self.dirty = sum(len(lines) for lines in self._pending.values())
+                raise
+            self._count_flushed(pending)
+            self._record_flush(sum(len(lines) for lines in pending.values()), writes, time.perf_counter() - start)
+            due = self._due_for_snapshot(pending)
+            if due:
+                snapshots = self._collect_snapshots(due)
+                start = time.perf_counter()
+                await loop.run_in_executor(None, compact_shards, snapshots)
+                self._record_snapshots(due, snapshots, time.perf_counter() - start)
+
+    def flush_sync(self):
+        if self._pending:
+            pending, writes = self._take_pending()
+            start = time.perf_counter()
+            append_journals(writes)
+            self._count_flushed(pending)
+            self._record_flush(sum(len(lines) for lines in pending.values()), writes, time.perf_counter() - start)
+            self.compact_sync(self._due_for_snapshot(pending))
+
+    def compact_sync(self, keys=None):
+        if keys is None:
+            keys = [key for key, count in self.journal_events.items() if count]
+        if not keys:
+            return
+        snapshots = self._collect_snapshots(keys)
+        start = time.perf_counter()
+        compact_shards(snapshots)
+        self._record_snapshots(keys, snapshots, time.perf_counter() - start)
+
+    def _record_snapshots(self, keys, snapshots, latency):
+        for key in keys:
+            if key in self.goals:
+                self.journal_events[key] = 0
+            else:
+                self.journal_events.pop(key, None)
+        self.snapshots += len(snapshots)
+        self.bytes_written += sum(len(payload) for _, _, payload in snapshots if payload is not None)
+        self.last_snapshot_latency = latency
+
+    async def close(self):
+        await super().close()
+        # Leave complete snapshots behind so a clean restart replays nothing
+        keys = [key for key, count in self.journal_events.items() if count]
+        if keys:
+            async with self._get_lock():
+                snapshots = self._collect_snapshots(keys)
+                start = time.perf_counter()
+                await asyncio.get_running_loop().run_in_executor(None, compact_shards, snapshots)
+                self._record_snapshots(keys, snapshots, time.perf_counter() - start)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            'journal_events': sum(self.journal_events.values()),
+            'replayed_events': self.replayed_events,
+            'snapshots': self.snapshots,
+            'last_snapshot_latency': self.last_snapshot_latency,
+        })
+        return stats
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS goals (
+    id INTEGER PRIMARY KEY,
+    key TEXT,
+    name TEXT NOT NULL,
+    channel_id INTEGER,
+    effective_days INTEGER NOT NULL,
+    rest INTEGER NOT NULL,
+    last_reset TEXT,
+    timezone TEXT,
+    active INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS goals_by_key ON goals (key, active);
+CREATE TABLE IF NOT EXISTS goal_exercises (
+    goal_id INTEGER NOT NULL,
+    exercise TEXT NOT NULL,
+    total REAL NOT NULL,
+    daily_target REAL NOT NULL,
+    PRIMARY KEY (goal_id, exercise)
+);
+CREATE TABLE IF NOT EXISTS participants (
+    goal_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    rest_used INTEGER NOT NULL DEFAULT 0,
+    completed_days REAL NOT NULL DEFAULT 0,
+    daily_credit REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (goal_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS total_progress (
+    goal_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (goal_id, user_id, exercise)
+);
+CREATE TABLE IF NOT EXISTS daily_progress (
+    goal_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (goal_id, user_id, day, exercise)
+);
+CREATE INDEX IF NOT EXISTS daily_progress_by_day ON daily_progress (goal_id, day);
+"""
+
+UPSERT_DAILY = (
+    'INSERT INTO daily_progress (goal_id, user_id, day, exercise, amount) VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (goal_id, user_id, day, exercise) DO UPDATE SET amount = excluded.amount'
+)
+UPSERT_TOTAL = (
+    'INSERT INTO total_progress (goal_id, user_id, exercise, amount) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT (goal_id, user_id, exercise) DO UPDATE SET amount = excluded.amount'
+)
+
+
+def goal_day(goal):
+    return goal.get('last_reset', '').split(' ')[0] or date.today().isoformat()
+
+
+class SqliteStore(JsonStore):
+    """SQLite store (WAL mode) that keeps every day's progress.
+
+    The in-memory goals are still what commands read, but each event is
+    turned into point INSERT/UPDATEs on the rows it touched, batched into one
+    transaction per flush. Daily rows are keyed by (goal, user, day), so the
+    midnight reset just moves on to a new day instead of erasing the old one.
+    On first start goals from an existing JSON store at `json_path` are imported.
+    """
+
+    def __init__(self, path, json_path=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.json_path = json_path
+        self.goal_ids = {}
+        self._ops = []
+        self.dropped_events = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._next_goal_id = self.conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM goals').fetchone()[0]
+
+    def load(self):
+        row = self.conn.execute('SELECT id FROM goals LIMIT 1').fetchone()
+        if row is None and self.json_path:
+            shards, _ = read_json_goals(self.json_path)
+            if shards:
+                self.import_goals({key: shard['goal'] for key, shard in shards.items()})
+                print(f'Imported {len(shards)} goal(s) from {self.json_path} into {self.path}')
+        self.goals = self._load_goals()
+        return self.goals
+
+    def import_goals(self, goals):
+        with self.conn:
+            for key, goal in goals.items():
+                goal.setdefault('last_reset', date.today().isoformat() + ' 00:00:00')
+                compact_goal(goal)
+                self._run(self._insert_goal(key, goal))
+
+    def _load_goals(self):
+        goals = {}
+        self.goal_ids = {}
+        by_id = {}
+        for gid, key, name, channel_id, effective_days, rest, last_reset, timezone in self.conn.execute(
+                'SELECT id, key, name, channel_id, effective_days, rest, last_reset, timezone FROM goals WHERE active = 1'):
+            goal = {
+                'name': name,
+                'exercises': {},
+                'daily_targets': {},
+                'effective_days': effective_days,
+                'rest': rest,
+                'rest_used': {},
+                'participants': [],
+                'completed_days': {},
+                'daily_credit': {},
+                'channel_id': channel_id,
+            }
+            if last_reset is not None:
+                goal['last_reset'] = last_reset
+            if timezone is not None:
+                goal['timezone'] = timezone
+            goals[key] = by_id[gid] = goal
+            self.goal_ids[key] = gid
+        active = 'SELECT {} FROM {} t JOIN goals g ON g.id = t.goal_id AND g.active = 1'
+        for gid, ex, total, daily_target in self.conn.execute(
+                active.format('t.goal_id, t.exercise, t.total, t.daily_target', 'goal_exercises') + ' ORDER BY t.rowid'):
+            by_id[gid]['exercises'][ex] = total
+            by_id[gid]['daily_targets'][ex] = daily_target
+        for goal in by_id.values():
+            goal['total_progress'] = ProgressTable(goal['exercises'])
+            goal['daily_progress'] = ProgressTable(goal['exercises'])
+        for gid, user_id, rest_used, completed_days, daily_credit in self.conn.execute(
+                active.format('t.goal_id, t.user_id, t.rest_used, t.completed_days, t.daily_credit', 'participants') + ' ORDER BY t.rowid'):
+            goal = by_id[gid]
+            goal['participants'].append(user_id)
+            goal['rest_used'][user_id] = rest_used
+            goal['completed_days'][user_id] = completed_days
+            goal['daily_credit'][user_id] = daily_credit
+            goal['total_progress'].add(user_id)
+            goal['daily_progress'].add(user_id)
+        for gid, user_id, ex, amount in self.conn.execute(
+                active.format('t.goal_id, t.user_id, t.exercise, t.amount', 'total_progress')):
+            by_id[gid]['total_progress'][user_id][ex] = amount
+        for gid, user_id, ex, amount in self.conn.execute(
+                active.format('t.goal_id, t.user_id, t.exercise, t.amount', 'daily_progress')
+                + ' WHERE t.day = substr(g.last_reset, 1, 10)'):
+            by_id[gid]['daily_progress'][user_id][ex] = amount
+        return goals
+
+    def _insert_goal(self, key, goal):
+        # The goal id is allocated here so the rest of the batch can refer to it
+        gid = self.goal_ids[key] = self._next_goal_id
+        self._next_goal_id += 1
+        day = goal_day(goal)
+        ops = [
+            ('UPDATE goals SET active = 0 WHERE key = ? AND active = 1', (key,)),
+            ('INSERT INTO goals (id, key, name, channel_id, effective_days, rest, last_reset, timezone) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+             (gid, key, goal['name'], goal['channel_id'], goal['effective_days'], goal['rest'], goal.get('last_reset'),
+              goal.get('timezone'))),
+        ]
+        for ex, total in goal['exercises'].items():
+            ops.append(('INSERT INTO goal_exercises (goal_id, exercise, total, daily_target) VALUES (?, ?, ?, ?)',
+                        (gid, ex, total, goal['daily_targets'][ex])))
+        for user_id in goal['participants']:
+            ops.append(('INSERT INTO participants (goal_id, user_id, rest_used, completed_days, daily_credit) VALUES (?, ?, ?, ?, ?)',
+                        (gid, user_id, goal['rest_used'].get(user_id, 0), goal['completed_days'][user_id], goal['daily_credit'][user_id])))
+            for ex, amount in goal['total_progress'][user_id].items():
+                ops.append((UPSERT_TOTAL, (gid, user_id, ex, amount)))
+            for ex, amount in goal['daily_progress'][user_id].items():
+                ops.append((UPSERT_DAILY, (gid, user_id, day, ex, amount)))
+        return ops
+
+    def _ops_for(self, event):
+        # Events are applied to self.goals before they reach the store
+        kind = event['type']
+        key = event['key']
+        if kind == 'create_goal':
+            return self._insert_goal(key, event['goal'])
+        if kind == 'delete_goal':
+            # Kept for history, just no longer the channel's current goal
+            return [('UPDATE goals SET active = 0 WHERE id = ?', (self.goal_ids.pop(key),))]
+        if kind == 'move_goal':
+            gid = self.goal_ids[event['new_key']] = self.goal_ids.pop(key)
+            return [('UPDATE goals SET key = ? WHERE id = ?', (event['new_key'], gid))]
+        gid = self.goal_ids[key]
+        day = goal_day(self.goals[key])
+        if kind == 'join':
+            return [('INSERT OR IGNORE INTO participants (goal_id, user_id) VALUES (?, ?)', (gid, event['user']))]
+        if kind in ('record', 'fix'):
+            user_id = event['user']
+            ops = [
+                (UPSERT_DAILY, (gid, user_id, day, event['exercise'], event['daily'])),
+                (UPSERT_TOTAL, (gid, user_id, event['exercise'], event['total'])),
+            ]
+            if 'credit' in event:
+                ops.append(('UPDATE participants SET completed_days = ?, daily_credit = ? WHERE goal_id = ? AND user_id = ?',
+                            (event['completed_days'], event['credit'], gid, user_id)))
+            return ops
+        if kind in ('record_batch', 'completed_full', 'completed_half'):
+            user_id = event['user']
+            ops = [(UPSERT_DAILY, (gid, user_id, day, ex, amount)) for ex, amount in event['daily'].items()]
+            ops += [(UPSERT_TOTAL, (gid, user_id, ex, amount)) for ex, amount in event['total'].items()]
+            if 'credit' in event:
+                ops.append(('UPDATE participants SET completed_days = ?, daily_credit = ? WHERE goal_id = ? AND user_id = ?',
+                            (event['completed_days'], event['credit'], gid, user_id)))
+            return ops
+        if kind == 'claim_rest':
+            return [('UPDATE participants SET rest_used = ? WHERE goal_id = ? AND user_id = ?',
+                     (event['rest_used'], gid, event['user']))]
+        if kind == 'change_goal':
+            ops = []
+            for ex, target in event['targets'].items():
+                ops.append(('UPDATE goal_exercises SET daily_target = ? WHERE goal_id = ? AND exercise = ?', (target, gid, ex)))
+                ops.append(('UPDATE daily_progress SET amount = MIN(amount, ?) WHERE goal_id = ? AND day = ? AND exercise = ?',
+                            (target, gid, day, ex)))
+            return ops
+        if kind == 'set_timezone':
+            ops = [('UPDATE goals SET timezone = ? WHERE id = ?', (event['timezone'], gid))]
+            if 'last_reset' in event:
+                # Today's rows move to the date the day has in the new timezone, which bot.py keeps unused
+                current = '(SELECT substr(last_reset, 1, 10) FROM goals WHERE id = ?)'
+                ops = [
+                    (f'UPDATE daily_progress SET day = ? WHERE goal_id = ? AND day = {current}', (day, gid, gid)),
+                    ('UPDATE goals SET last_reset = ? WHERE id = ?', (event['last_reset'], gid)),
+                ] + ops
+            return ops
+        if kind == 'reset':
+            # Yesterday's rows stay as history; today starts with no rows
+            return [
+                ('UPDATE goals SET last_reset = ? WHERE id = ?', (event['at'], gid)),
+                ('UPDATE participants SET daily_credit = 0 WHERE goal_id = ?', (gid,)),
+            ]
+        raise ValueError(f'Unknown event type: {kind}')
+
+    def append(self, event):
+        # Kept per event, so one that SQLite rejects can be dropped without the rest
+        self._ops.append((f"{event['type']} {event['key']}", self._ops_for(event)))
+        self.mark_dirty()
+
+    def _run(self, ops):
+        for sql, params in ops:
+            self.conn.execute(sql, params)
+
+    def _write(self, batch):
+        # One transaction for the batch. If SQLite rejects a statement, each event is retried in
+        # its own transaction and the rejected ones are dropped, so one bad event cannot block
+        # every later save. Operational errors (locked database, full disk) keep the whole batch.
+        try:
+            with self.conn:
+                for _, ops in batch:
+                    self._run(ops)
+            return
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.DatabaseError:
+            pass
+        for label, ops in batch:
+            try:
+                with self.conn:
+                    self._run(ops)
+            except sqlite3.DatabaseError as e:
+                self.dropped_events += 1
+                print(f'Dropped {label} from {self.path}: {e}')
+
+    async def flush(self):
+        if not self._ops:
+            return
+        async with self._get_lock():
+            batch = self._ops
+            if not batch:
+                return
+            pending = self.dirty
+            self._ops = []
+            self.dirty = 0
+            start = time.perf_counter()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, batch)
+            except BaseException:
+                self._ops = batch + self._ops
+                self.dirty += pending
+                raise
+            self._record_statements(pending, batch, time.perf_counter() - start)
+
+    def flush_sync(self):
+        if not self._ops:
+            return
+        batch = self._ops
+        pending = self.dirty
+        self._ops = []
+        self.dirty = 0
+        start = time.perf_counter()
+        self._write(batch)
+        self._record_statements(pending, batch, time.perf_counter() - start)
+
+    def _record_statements(self, pending, batch, latency):
+        self.flushes += 1
+        # Every pending event shares one transaction
+        self.coalesced_writes += pending - 1
+        self.shards_written += sum(len(ops) for _, ops in batch)
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.total_flush_latency += latency
+
+    def stats(self):
+        stats = super().stats()
+        # Rows touched rather than files for this backend
+        stats['statements_written'] = stats.pop('shards_written')
+        del stats['bytes_written']
+        stats['dropped_events'] = self.dropped_events
+        return stats
+
+
+def open_store(path, backend='json', flush_interval=5.0, max_dirty=50, snapshot_every=1000):
+    if backend == 'sqlite':
+        return SqliteStore(os.path.splitext(path)[0] + '.db', json_path=path, flush_interval=flush_interval, max_dirty=max_dirty)
+    if backend == 'journal':
+        return JournalStore(path, snapshot_every=snapshot_every, flush_interval=flush_interval, max_dirty=max_dirty)
+    if backend == 'json':
+        return JsonStore(path, flush_interval=flush_interval, max_dirty=max_dirty)
+    raise ValueError(f'Unknown storage backend: {backend}')